@@ -1,7 +1,5 @@
-import numpy as np
-
 from two_process_nlp.utils import init_embedder
-from two_process_nlp.utils import w2e_to_sims
+from two_process_nlp.sims import reduce_sims, MeanStd
 from two_process_nlp.params import to_embedder_name
 
 from analyze.utils import gen_param2vals_for_completed_jobs
@@ -17,17 +15,19 @@ for param2val in gen_param2vals_for_completed_jobs():
     embedder = init_embedder(param2val)
     embedder.load_w2e()
     #
-    vocab_sims_mat = w2e_to_sims(embedder.w2e, embedder.vocab, embedder.vocab)
-    embedder_name2plot_data[embedder_name].append((vocab_sims_mat.mean(), vocab_sims_mat.std()))
+    mean_sim, std_sim = reduce_sims(  # in blocks - vocab x vocab matrix is never in memory
+        embedder.w2e, MeanStd(), embedder.vocab, embedder.vocab)
+    embedder_name2plot_data[embedder_name].append((mean_sim, std_sim))
     print(embedder_name)
-    print(vocab_sims_mat.mean())
-    print(vocab_sims_mat.std())
+    print(mean_sim)
+    print(std_sim)
     #
-    col_ids = np.argmin(vocab_sims_mat, axis=1)
-    print(vocab_sims_mat[np.arange(len(vocab_sims_mat)), col_ids])
+    neighbour_index = embedder.load_neighbour_index()  # cached in run directory
+    print(neighbour_index.farthest_sims[:, 0])
 
     # TODO are pairs with lowest (negative) cosine sim antonyms?
-    for row_id, col_id in list(enumerate(col_ids))[1000:1100]:
-        print(embedder.vocab[row_id], embedder.vocab[col_id])
-        print(vocab_sims_mat[row_id, col_id])
+    for w in embedder.vocab[1000:1100]:
+        farthest_w, sim = neighbour_index.farthest(w, 1)[0]
+        print(w, farthest_w)
+        print(sim)
         print()
\ No newline at end of file
@@ -0,0 +1,59 @@
+import time
+import numpy as np
+
+from two_process_nlp.embeddings import EmbeddingTable
+from two_process_nlp.neighbours import ApproxNeighbourIndex
+
+NUM_VOCAB = 50000
+EMBED_SIZE = 200
+NUM_CLUSTERS = 1000  # embeddings of real words are clustered - uniformly random embeddings have no neighbours
+NOISE = 1.0
+NUM_QUERIES = 200
+K = 10
+NUM_PROBES = [1, 2, 4, 8, 16, 32]
+
+
+def make_embeddings(num_vocab, embed_size, num_clusters, noise, seed=42):
+    random_state = np.random.RandomState(seed)
+    centers = random_state.randn(num_clusters, embed_size)
+    res = centers[random_state.randint(0, num_clusters, num_vocab)] + noise * random_state.randn(num_vocab, embed_size)
+    return res.astype(np.float32)
+
+
+vocab = ['w{}'.format(i) for i in range(NUM_VOCAB)]
+w2e = EmbeddingTable(make_embeddings(NUM_VOCAB, EMBED_SIZE, NUM_CLUSTERS, NOISE), vocab)
+query_ids = np.random.RandomState(0).choice(NUM_VOCAB, NUM_QUERIES, replace=False)
+x = w2e.normalized
+
+# exact
+start = time.time()
+exact_ids = []
+for row_id in query_ids:
+    keys = -x.dot(x[row_id])
+    keys[row_id] = np.inf
+    col_ids = np.argpartition(keys, K - 1)[:K]
+    exact_ids.append(set(col_ids.tolist()))
+exact_duration = time.time() - start
+
+# approximate
+start = time.time()
+index = ApproxNeighbourIndex.build(w2e)
+build_duration = time.time() - start
+results = []
+for num_probes in NUM_PROBES:
+    start = time.time()
+    num_found = 0
+    for row_id, exact in zip(query_ids, exact_ids):
+        ids, _ = index.query(x[row_id], K, num_probes, exclude_id=row_id)
+        num_found += len(exact.intersection(ids.tolist()))
+    duration = time.time() - start
+    results.append((num_probes, num_found / (NUM_QUERIES * K), duration))
+
+print()
+print('Querying {} neighbours of {} words in vocab of size {} with embed_size={}'.format(
+    K, NUM_QUERIES, NUM_VOCAB, EMBED_SIZE))
+print('Built index with {} partitions in {:.3f} sec'.format(index.num_partitions, build_duration))
+print('{:<10} {:>10} {:>12.3f} sec'.format('exact', '1.000', exact_duration))
+for num_probes, recall, duration in results:
+    print('probes={:<3} {:>10.3f} {:>12.3f} sec {:>8.1f}x speed-up'.format(
+        num_probes, recall, duration, exact_duration / duration))
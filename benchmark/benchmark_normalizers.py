@@ -0,0 +1,46 @@
+import time
+import numpy as np
+from scipy import sparse
+
+from two_process_nlp.embedders.count import CountEmbedder
+
+NUM_VOCAB = 4096
+DENSITY = 0.01  # proportion of non-zero cells in synthetic count matrix
+MAX_DENSE_NUM_VOCAB = 4096  # dense matrices larger than this take too much memory
+NUM_REPS = 3
+NORM_TYPES = ['row_sum', 'col_sum', 'tf_idf', 'row_logentropy', 'ppmi']
+
+
+def make_count_matrix(num_vocab, density, seed=42):
+    np.random.seed(seed)
+    res = sparse.random(num_vocab, num_vocab, density=density, format='csr',
+                        data_rvs=lambda size: np.random.zipf(2.0, size))
+    return res
+
+
+embedder = CountEmbedder({'param_name': 'benchmark',
+                          'job_name': 'benchmark',
+                          'count_type': ['ww', 'forward', 7, 'linear'],
+                          'norm_type': None,
+                          'reduce_type': [None, None]})
+sparse_count_mat = make_count_matrix(NUM_VOCAB, DENSITY)
+count_mats = [('sparse', sparse_count_mat)]
+if NUM_VOCAB <= MAX_DENSE_NUM_VOCAB:
+    count_mats.append(('dense', sparse_count_mat.toarray()))
+num_cells = NUM_VOCAB * NUM_VOCAB
+
+results = []
+for norm_type in NORM_TYPES:
+    for mat_type, count_mat in count_mats:
+        durations = []
+        for _ in range(NUM_REPS):
+            start = time.time()
+            embedder.normalize(count_mat, norm_type)
+            durations.append(time.time() - start)
+        results.append((norm_type, mat_type, min(durations)))
+
+print()
+print('Normalizing {}x{} count matrix with density={}'.format(NUM_VOCAB, NUM_VOCAB, DENSITY))
+for norm_type, mat_type, duration in results:
+    print('{:<16} {:<6} {:>8.3f} sec {:>16,.0f} cells/sec'.format(
+        norm_type, mat_type, duration, num_cells / duration))
@@ -0,0 +1,52 @@
+import time
+import numpy as np
+
+from two_process_nlp.embedders.count import CountEmbedder
+from two_process_nlp.corpus import NumericCorpus
+from two_process_nlp import config
+
+NUM_VOCAB = 16384
+NUM_DOCS = 2000
+MEAN_DOC_LENGTH = 2500  # similar to a CHILDES transcript
+WORKER_COUNTS = [1, 2, 4, 8]
+COUNT_TYPE = ['ww', 'forward', 7, 'linear']
+
+
+def make_numeric_docs(num_vocab, num_docs, mean_doc_length, seed=42):
+    np.random.seed(seed)
+    res = []
+    for doc_length in np.random.poisson(mean_doc_length, num_docs):
+        token_ids = (np.random.zipf(1.2, doc_length) - 1) % num_vocab  # word frequencies are roughly zipfian
+        res.append(token_ids.tolist())
+    return res
+
+
+config.Count.cache_count_matrices = False
+embedder = CountEmbedder({'param_name': 'benchmark',
+                          'job_name': 'benchmark',
+                          'count_type': COUNT_TYPE,
+                          'norm_type': None,
+                          'reduce_type': [None, None]})
+embedder.vocab = [str(i) for i in range(NUM_VOCAB)]
+embedder.numeric_docs = NumericCorpus.from_docs(make_numeric_docs(NUM_VOCAB, NUM_DOCS, MEAN_DOC_LENGTH))
+num_tokens = embedder.numeric_docs.num_tokens
+
+results = []
+serial_count_mat = None
+for num_workers in WORKER_COUNTS:
+    config.Count.num_count_workers = num_workers
+    start = time.time()
+    count_mat = embedder.count_ww_matrix(COUNT_TYPE[2], COUNT_TYPE[3])
+    duration = time.time() - start
+    # check that result is identical to serial count
+    if serial_count_mat is None:
+        serial_count_mat = count_mat
+    is_identical = (count_mat != serial_count_mat).nnz == 0
+    results.append((num_workers, duration, is_identical))
+
+print()
+print('Counting {:,} tokens in {:,} docs with vocab size={}'.format(num_tokens, NUM_DOCS, NUM_VOCAB))
+serial_duration = results[0][1]
+for num_workers, duration, is_identical in results:
+    print('num_workers={:>2} {:>8.2f} sec {:>14,.0f} tokens/sec speed-up={:.2f} identical={}'.format(
+        num_workers, duration, num_tokens / duration, serial_duration / duration, is_identical))
@@ -8,7 +8,6 @@ from two_process_nlp.embedders.random_control import RandomControlEmbedder
 from two_process_nlp.params import RandomControlParams
 from two_process_nlp.architectures import comparator
 from two_process_nlp.evaluators.matching import Matching
-from two_process_nlp.utils import w2e_to_sims
 from two_process_nlp.params import gen_combinations
 from two_process_nlp.embedders.base import EmbedderBase
 from two_process_nlp import config
@@ -56,9 +55,8 @@ embedder = next(embedders)
 embedder.train()  # populates w2e
 # evaluator
 ev = Matching(comparator, 'nyms', NYM_TYPE, suffix='_unfiltered')
-vocab_sims_mat = w2e_to_sims(embedder.w2e, embedder.vocab, embedder.vocab)
 all_eval_probes, all_eval_candidates_mat = ev.make_all_eval_data(
-    vocab_sims_mat, embedder.vocab)  # populates probe2relata
+    embedder.vocab_sims, embedder.vocab)  # populates probe2relata
 ev.row_words, ev.col_words, ev.eval_candidates_mat = ev.downsample(
                         all_eval_probes, all_eval_candidates_mat, seed=0)
 row_and_col_words = set(ev.row_words + ev.col_words)
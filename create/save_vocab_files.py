@@ -1,9 +1,8 @@
-
 from two_process_nlp.job import preprocessing_job
 from two_process_nlp import config
 
 SKIP_DOCS = False
 LOCAL = True
+INCREMENTAL = False  # only preprocess lines appended to corpus since last run
 
-for vocab_size in config.Corpus.vocab_sizes:
-    preprocessing_job(vocab_size, skip_docs=SKIP_DOCS, local=LOCAL)
\ No newline at end of file
+preprocessing_job(config.Corpus.vocab_sizes, skip_docs=SKIP_DOCS, local=LOCAL, incremental=INCREMENTAL)  # tokenizes only once
@@ -0,0 +1,9 @@
+from two_process_nlp import config
+from two_process_nlp.embeddings import embeddings_exist, convert_txt_embeddings
+
+
+for p in config.RemoteDirs.runs.rglob('embeddings.txt'):
+    if embeddings_exist(p.parent):
+        continue
+    print(p)
+    convert_txt_embeddings(p.parent)
@@ -155,9 +155,7 @@ for param2val in gen_param2vals_for_completed_jobs():
         print(embedder.name)
     embedder.load_w2e()
     #
-    probe_embed_mat = np.zeros((num_probes, embedder.dim1))
-    for n, p in enumerate(probes):
-        probe_embed_mat[n] = embedder.w2e[p]
+    probe_embed_mat = embedder.w2e.gather(probes)
     true_col = [True for p in probes]
     false_col = [False for p in probes]
     #
@@ -2,7 +2,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 from two_process_nlp.utils import init_embedder
-from two_process_nlp.utils import w2e_to_sims
+from two_process_nlp.sims import reduce_sims, MeanStd
 from two_process_nlp.params import to_embedder_name
 
 from analyze.utils import gen_param2vals_for_completed_jobs
@@ -20,11 +20,11 @@ for param2val in gen_param2vals_for_completed_jobs():
     embedder = init_embedder(param2val)
     embedder.load_w2e()
     #
-    vocab_sims_mat = w2e_to_sims(embedder.w2e, embedder.vocab, embedder.vocab)
-    embedder_name2plot_data[embedder_name].append((vocab_sims_mat.mean(), vocab_sims_mat.std()))
+    mean_sim, std_sim = reduce_sims(embedder.w2e, MeanStd(), embedder.vocab, embedder.vocab)  # in blocks
+    embedder_name2plot_data[embedder_name].append((mean_sim, std_sim))
     print(embedder_name)
-    print(vocab_sims_mat.mean())
-    print(vocab_sims_mat.std())
+    print(mean_sim)
+    print(std_sim)
 
 # figure
 embedder_name2color = {embedder_name: plt.cm.get_cmap('tab10')(n)
@@ -58,8 +58,8 @@ for param2val in gen_param2vals_for_completed_jobs():
         elif WHICH_PAIRS == 'pos':
             pos_sims = []
             for probe, relata in ev.probe2relata.items():
-                a = np.expand_dims(embedder.w2e[probe], axis=0)
-                b = np.asarray([embedder.w2e[r] for r in relata])
+                a = embedder.w2e.gather([probe])
+                b = embedder.w2e.gather(list(relata))
                 pos_sims_for_probe = cosine_similarity(a, b)
                 pos_sims.extend(pos_sims_for_probe.flatten())
             mean_sim = np.mean(pos_sims)
@@ -50,8 +50,8 @@ def split_and_vectorize_eval_data(evaluator, trial, w2e, fold_id, shuffled):
             test_pairs.add((p, c))
             test_pairs.add((c, p))  # crucial to collect both orderings
         #
-        x1_test += [[w2e[probe]] * len(candidates)]
-        x2_test += [[w2e[c] for c in candidates]]
+        x1_test += [[probe] * len(candidates)]
+        x2_test += [list(candidates)]
         eval_sims_mat_row_ids_test.append(eval_sims_mat_row_id)
     # train
     num_skipped = 0
@@ -67,14 +67,14 @@ def split_and_vectorize_eval_data(evaluator, trial, w2e, fold_id, shuffled):
                         num_skipped += 1
                         continue
                     if c in evaluator.probe2relata[p] or evaluator.check_negative_example(trial, p, c):
-                        x1_train.append(w2e[p])
-                        x2_train.append(w2e[c])
+                        x1_train.append(p)
+                        x2_train.append(c)
                         y_train.append(1 if c in evaluator.probe2relata[p] else 0)
-    x1_train = np.vstack(x1_train)
-    x2_train = np.vstack(x2_train)
+    x1_train = w2e.gather(x1_train)  # words to embeddings in one step
+    x2_train = w2e.gather(x2_train)
     y_train = np.array(y_train)
-    x1_test = np.array(x1_test)
-    x2_test = np.array(x2_test)
+    x1_test = w2e.gather(x1_test)
+    x2_test = w2e.gather(x2_test)
     # console
     print('Num pairs skipped due to occurrence in test={}'.format(num_skipped))
     # shuffle x-y mapping
@@ -209,7 +209,7 @@ def train_expert_on_train_fold(evaluator, trial, w2e, graph, data, fold_id):
             start = time.time()
             # save transformed word embeddings
             if fold_id == 0:
-                x1_all = np.vstack((w2e[p] for p in evaluator.row_words))
+                x1_all = w2e.gather(evaluator.row_words)
                 x2_all = np.mean(x1_all, axis=0, keepdims=True).repeat(len(x1_all), axis=0)
                 # TODO it is incorrect to feed x_all to graph.x2 - feed an average of x_all to graph.x2?
                 process2_embeds_mat = graph.sess.run(graph.o1, feed_dict={graph.x1: x1_all, graph.x2: x2_all})
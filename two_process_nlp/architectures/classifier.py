@@ -51,7 +51,7 @@ def split_and_vectorize_eval_data(evaluator, trial, w2e, fold_id, shuffled):
             test_pairs.add((p, c))
             test_pairs.add((c, p))  # crucial to collect both orderings
         #
-        x1_test += [[w2e[probe]] * len(candidates)]
+        x1_test += [[probe] * len(candidates)]
         x2_test += [[evaluator.col_words.index(c) for c in candidates]]
         eval_sims_mat_row_ids_test.append(eval_sims_mat_row_id)
     # train
@@ -68,13 +68,13 @@ def split_and_vectorize_eval_data(evaluator, trial, w2e, fold_id, shuffled):
                         num_skipped += 1
                         continue
                     if c in evaluator.probe2relata[p] or evaluator.check_negative_example(trial, p, c):
-                        x1_train.append(w2e[p])
+                        x1_train.append(p)
                         x2_train.append(evaluator.col_words.index(c))
                         y_train.append(1.0 if c in evaluator.probe2relata[p] else 0.0)
-    x1_train = np.vstack(x1_train)
+    x1_train = w2e.gather(x1_train)  # words to embeddings in one step
     x2_train = np.array(x2_train)
     y_train = np.array(y_train)
-    x1_test = np.array(x1_test)
+    x1_test = w2e.gather(x1_test)
     x2_test = np.array(x2_test)
     # console
     print('Num pairs skipped due to occurrence in test={}'.format(num_skipped))
@@ -91,7 +91,7 @@ def make_graph(evaluator, trial, w2e, embed_size):
 
     # smart weight init
     sims_mat = w2e_to_sims(w2e, evaluator.row_words, evaluator.col_words)
-    embed_mat = np.vstack([w2e[w] for w in evaluator.row_words])
+    embed_mat = w2e.gather(evaluator.row_words)
     wy_init = np.zeros((embed_size, num_outputs))
     for n, sims_mat_col in enumerate(sims_mat.T):
         x, res, rank, s = np.linalg.lstsq(embed_mat, sims_mat_col, rcond=None)
@@ -0,0 +1,20 @@
+import os
+import shutil
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_path(p):
+    """
+    yield a temporary path next to p (file or directory), which is renamed to p when the block completes.
+    rename is atomic, so readers never see partial files. the temporary path is removed if anything fails
+    """
+    tmp_p = p.with_name('{}.tmp{}{}'.format(p.stem, os.getpid(), p.suffix))  # suffix is kept for np.save
+    try:
+        yield tmp_p
+        os.replace(str(tmp_p), str(p))
+    finally:
+        if tmp_p.is_dir():
+            shutil.rmtree(str(tmp_p))
+        elif tmp_p.exists():
+            tmp_p.unlink()
@@ -50,6 +50,13 @@ class Eval:
 
 class Embeddings:
     save_w2e = True
+    save_txt = False  # also save embeddings.txt - binary embeddings.npy is always saved
+    sims_block_size = 1024  # number of rows of similarity matrix computed at once
+    num_neighbours = 100  # number of nearest and farthest neighbours saved by neighbour index
+    num_partitions = None  # partitions of approximate neighbour index - if None, sqrt(vocab size)
+    num_probes = 8  # partitions searched per query by approximate neighbour index - more gives higher recall
+    num_kmeans_iterations = 10
+    kmeans_seed = 42
     verbose = True
     precision = 5
 
@@ -60,6 +67,29 @@ class Corpus:
     # name = 'tasa-20181213'
     num_vocab = 16384  # TODO test
     vocab_sizes = [4096, 8192, 16384]  # also: 4096, 8192, 16384
+    tokenizer = 'spacy'  # also: 'whitespace' - for corpora that are already tokenized
+
+
+class Preprocessing:
+    num_processes = 4  # tokenization
+    chunk_size = 1000  # number of docs tokenized at once by each process
+    verify_tokenizer = True  # compare whitespace tokenization to spacy on a sample of docs before using it
+    num_verification_docs = 100
+    verification_seed = 42
+
+
+class Count:
+    num_count_workers = 4  # word-word co-occurrences are counted in shards in separate processes
+    cache_count_matrices = True  # raw counts are re-used by all norm_type and reduce_type combinations
+    cache_svds = True  # svd at largest reduce size is re-used by all smaller reduce sizes
+    rsvd_num_oversamples = 10  # more oversamples and power iterations: more accurate but slower
+    rsvd_num_power_iterations = 4
+    rsvd_block_size = 4096  # number of rows multiplied at once
+    rsvd_memmap = False  # normalized matrix is moved to disk before rsvd, and row blocks are streamed from there
+    rva_vector_type = 'normal'  # 'normal' or 'ternary' (sparse +1/-1 random index vectors)
+    rva_num_nonzero = 8  # number of non-zero entries in each ternary random vector
+    rva_block_size = 4096  # number of rows multiplied at once
+    rva_seed = 42
 
 
 class Glove:
@@ -0,0 +1,281 @@
+import hashlib
+import io
+import numpy as np
+import os
+import shutil
+import tempfile
+from itertools import chain
+
+from two_process_nlp.atomic import atomic_path
+
+
+class NumericCorpus(object):
+    """
+    token ids of all docs in a single flat int32 array, and the offset of each doc into that array.
+    docs are returned as views into the flat array, so no data is copied - also when arrays are memory-mapped
+    """
+    def __init__(self, token_ids, doc_offsets):
+        self.token_ids = token_ids
+        self.doc_offsets = doc_offsets
+
+    @classmethod
+    def from_docs(cls, numeric_docs):
+        doc_lengths = [len(doc) for doc in numeric_docs]
+        doc_offsets = np.zeros(len(doc_lengths) + 1, dtype=np.int64)
+        np.cumsum(doc_lengths, out=doc_offsets[1:])
+        token_ids = np.fromiter(chain.from_iterable(numeric_docs), dtype=np.int32, count=doc_offsets[-1])
+        return cls(token_ids, doc_offsets)
+
+    # ///////////////////////////////////////////////////////////// io
+
+    @staticmethod
+    def make_paths(root, name):
+        token_ids_p = root / '{}_token_ids.npy'.format(name)
+        doc_offsets_p = root / '{}_doc_offsets.npy'.format(name)
+        return token_ids_p, doc_offsets_p
+
+    @classmethod
+    def exists(cls, root, name):
+        return all([p.exists() for p in cls.make_paths(root, name)])
+
+    def save(self, root, name):
+        token_ids_p, doc_offsets_p = self.make_paths(root, name)
+        np.save(str(token_ids_p), np.asarray(self.token_ids, dtype=np.int32))
+        np.save(str(doc_offsets_p), np.asarray(self.doc_offsets, dtype=np.int64))
+
+    @classmethod
+    def load(cls, root, name):
+        """
+        memory-mapped - pages are loaded only when accessed, and are shared by all processes reading the same files
+        """
+        token_ids_p, doc_offsets_p = cls.make_paths(root, name)
+        token_ids = np.load(str(token_ids_p), mmap_mode='r')
+        doc_offsets = np.load(str(doc_offsets_p), mmap_mode='r')
+        return cls(token_ids, doc_offsets)
+
+    # ///////////////////////////////////////////////////////////// docs
+
+    def __len__(self):
+        return len(self.doc_offsets) - 1
+
+    def __getitem__(self, doc_id):
+        return self.token_ids[self.doc_offsets[doc_id]:self.doc_offsets[doc_id + 1]]
+
+    def __iter__(self):
+        for doc_id in range(len(self)):
+            yield self[doc_id]
+
+    def gen_doc_chunks(self, chunk_size, start_doc=0):
+        """
+        yield token ids (concatenated) and doc lengths of chunk_size docs at a time, starting at start_doc
+        """
+        for start in range(start_doc, len(self), chunk_size):
+            stop = min(start + chunk_size, len(self))
+            offsets = np.asarray(self.doc_offsets[start:stop + 1])
+            yield np.asarray(self.token_ids[offsets[0]:offsets[-1]]), np.diff(offsets)
+
+    @property
+    def num_tokens(self):
+        return len(self.token_ids)
+
+    @property
+    def doc_lengths(self):
+        return np.diff(self.doc_offsets)
+
+    @property
+    def doc_ids(self):
+        """
+        id of the doc each token belongs to - parallel to token_ids
+        """
+        return np.repeat(np.arange(len(self)), self.doc_lengths)
+
+
+class Docs(object):
+    """
+    string docs as a lazy view over a NumericCorpus and its vocab - a doc is created only when accessed.
+    saved as a single immutable artifact which is named by its content hash,
+    so any number of processes can memory-map it concurrently
+    """
+    def __init__(self, numeric_corpus, vocab):
+        self.numeric_corpus = numeric_corpus
+        self.vocab = vocab
+        self.vocab_array = np.asarray(vocab, dtype=object)
+
+    def __len__(self):
+        return len(self.numeric_corpus)
+
+    def __getitem__(self, doc_id):
+        return self.vocab_array[self.numeric_corpus[doc_id]].tolist()
+
+    def __iter__(self):  # can be iterated over multiple times, e.g. by gensim
+        for doc_id in range(len(self)):
+            yield self[doc_id]
+
+    # ///////////////////////////////////////////////////////////// io
+
+    @staticmethod
+    def make_pointer_path(root, name):
+        """
+        text file containing the name of the current artifact directory
+        """
+        return root / '{}_docs.txt'.format(name)
+
+    @classmethod
+    def exists(cls, root, name):
+        return cls.make_pointer_path(root, name).exists()
+
+    @classmethod
+    def save(cls, root, name, vocab):
+        """
+        copy numeric corpus saved under name, and vocab, into an artifact directory named by their content hash -
+        and point to it. the previous artifact is removed.
+        numeric corpus files are appended to in place, so they are copied, not linked
+        """
+        src_paths = NumericCorpus.make_paths(root, name)
+        vocab_str = ''.join(['{}\n'.format(v) for v in vocab])
+        h = hashlib.sha1()
+        for p in src_paths:
+            with p.open('rb') as f:
+                for block in iter(lambda: f.read(2 ** 20), b''):
+                    h.update(block)
+        h.update(vocab_str.encode('utf-8'))
+        dir_p = root / '{}_docs_{}'.format(name, h.hexdigest()[:12])
+        if not dir_p.exists():  # artifact is immutable - same content is never written twice
+            try:
+                with atomic_path(dir_p) as tmp_dir_p:
+                    tmp_dir_p.mkdir()
+                    for src_p, dst_p in zip(src_paths, NumericCorpus.make_paths(tmp_dir_p, 'docs')):
+                        shutil.copyfile(str(src_p), str(dst_p))
+                    (tmp_dir_p / 'vocab.txt').write_text(vocab_str, encoding='utf-8')
+            except OSError:  # another process may have saved the same artifact first
+                if not dir_p.exists():
+                    raise
+        pointer_p = cls.make_pointer_path(root, name)
+        old_dir_name = pointer_p.read_text().strip() if pointer_p.exists() else None
+        with atomic_path(pointer_p) as tmp_pointer_p:
+            tmp_pointer_p.write_text(dir_p.name)
+        # processes which memory-mapped the old artifact can still read it - its files are only unlinked
+        if old_dir_name is not None and old_dir_name != dir_p.name:
+            shutil.rmtree(str(root / old_dir_name), ignore_errors=True)
+        return dir_p
+
+    @classmethod
+    def load(cls, root, name):
+        dir_p = root / cls.make_pointer_path(root, name).read_text().strip()
+        numeric_corpus = NumericCorpus.load(dir_p, 'docs')
+        vocab = (dir_p / 'vocab.txt').read_text(encoding='utf-8').splitlines()
+        return cls(numeric_corpus, vocab)
+
+
+class NumericCorpusWriter(object):
+    """
+    write docs to disk one at a time, so that memory use does not depend on corpus size.
+    token ids and doc offsets are spooled to temporary files, and converted to .npy files on close.
+    if append, docs are added to the end of an existing corpus - token ids after the last doc offset
+    (written by a run which died before its doc offsets were saved) are overwritten
+    """
+    def __init__(self, root, name, append=False):
+        self.root = root
+        self.name = name
+        self.append = append
+        self.token_ids_f = tempfile.TemporaryFile()
+        self.doc_offsets_f = tempfile.TemporaryFile()
+        if append:
+            self.num_tokens = int(NumericCorpus.load(root, name).doc_offsets[-1])
+            self.num_old_tokens = self.num_tokens
+        else:
+            self.num_tokens = 0
+            self.doc_offsets_f.write(np.zeros(1, dtype=np.int64).tobytes())
+
+    def add_doc(self, token_ids):
+        token_ids = np.asarray(token_ids, dtype=np.int32)
+        self.token_ids_f.write(token_ids.tobytes())
+        self.num_tokens += len(token_ids)
+        self.doc_offsets_f.write(np.array([self.num_tokens], dtype=np.int64).tobytes())
+
+    def add_docs(self, token_ids, doc_lengths):
+        """
+        add multiple docs at once - token_ids of all docs are concatenated
+        """
+        token_ids = np.asarray(token_ids, dtype=np.int32)
+        doc_offsets = self.num_tokens + np.cumsum(doc_lengths, dtype=np.int64)
+        self.token_ids_f.write(token_ids.tobytes())
+        self.num_tokens += len(token_ids)
+        self.doc_offsets_f.write(doc_offsets.tobytes())
+
+    def close(self):
+        token_ids_p, doc_offsets_p = NumericCorpus.make_paths(self.root, self.name)
+        # token ids first - doc offsets only ever point to token ids that were saved
+        spool_to_npy(self.token_ids_f, token_ids_p, np.int32, self.append,
+                     num_old=self.num_old_tokens if self.append else None)
+        spool_to_npy(self.doc_offsets_f, doc_offsets_p, np.int64, self.append)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:  # do not save incomplete corpus
+            self.token_ids_f.close()
+            self.doc_offsets_f.close()
+
+
+def make_npy_header(dtype, length):
+    f = io.BytesIO()
+    np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(dtype),
+                                             'fortran_order': False,
+                                             'shape': (length,)})
+    return f.getvalue()
+
+
+def spool_to_npy(spool_f, p, dtype, append=False, num_old=None):
+    """
+    write .npy header followed by raw contents of spool_f - without loading contents into memory.
+    if append, contents are added after the first num_old elements (default: all) of the existing 1D array in p -
+    only the header is re-written, unless the new header is longer than the old one.
+    header is re-written after the contents, so a run which dies in between leaves the old array intact
+    """
+    dtype = np.dtype(dtype)
+    length = spool_f.tell() // dtype.itemsize
+    spool_f.seek(0)
+    if append:
+        with p.open('rb') as f:
+            version = np.lib.format.read_magic(f)
+            shape, _, old_dtype = np.lib.format.read_array_header_1_0(f) if version == (1, 0) else (None, None, None)
+            data_start = f.tell()
+        if old_dtype != dtype:
+            raise AttributeError('Cannot append {} to {}.'.format(dtype, p))
+        num_old = shape[0] if num_old is None else num_old
+        if num_old > shape[0]:
+            raise AttributeError('Cannot keep {} elements of {} with {} elements.'.format(num_old, p, shape[0]))
+        header = make_npy_header(dtype, num_old + length)
+        if len(header) == data_start:
+            with p.open('r+b') as f:
+                f.seek(data_start + num_old * dtype.itemsize)  # bytes after old array are left by a run which died
+                shutil.copyfileobj(spool_f, f)
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+                f.seek(0)
+                f.write(header)
+        else:  # header does not fit - re-write whole file
+            with atomic_path(p) as tmp_p, tmp_p.open('wb') as f, p.open('rb') as old_f:
+                f.write(header)
+                old_f.seek(data_start)
+                copy_bytes(old_f, f, num_old * dtype.itemsize)
+                shutil.copyfileobj(spool_f, f)
+    else:
+        with p.open('wb') as f:
+            f.write(make_npy_header(dtype, length))
+            shutil.copyfileobj(spool_f, f)
+    spool_f.close()
+
+
+def copy_bytes(src_f, dst_f, num_bytes):
+    while num_bytes > 0:
+        block = src_f.read(min(2 ** 20, num_bytes))
+        if not block:
+            break
+        dst_f.write(block)
+        num_bytes -= len(block)
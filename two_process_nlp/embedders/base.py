@@ -1,10 +1,10 @@
 import numpy as np
 from cached_property import cached_property
-import pickle
-import socket
-
-from sortedcontainers import SortedDict
 
+from two_process_nlp.corpus import NumericCorpus, Docs
+from two_process_nlp.embeddings import EmbeddingTable, VocabSims
+from two_process_nlp.neighbours import NeighbourIndex, ApproxNeighbourIndex
+from two_process_nlp.embeddings import save_embeddings, load_embeddings, embeddings_exist, convert_txt_embeddings
 from two_process_nlp import config
 
 
@@ -13,6 +13,7 @@ class EmbedderBase(object):
         self.param_name = param_name
         self.job_name = job_name
         self.w2e = dict()  # is populated by child class
+        self._vocab_sims = None
 
     @property
     def location(self):
@@ -33,23 +34,49 @@ class EmbedderBase(object):
     # ///////////////////////////////////////////////////////////// w2e
 
     def save_w2e(self):
-        p = self.location / 'embeddings.txt'
-        with p.open('w') as f:
-            for probe, embedding in sorted(self.w2e.items()):
-                embedding_str = ' '.join(np.around(embedding, config.Embeddings.precision).astype(np.str).tolist())
-                f.write('{} {}\n'.format(probe, embedding_str))
+        save_embeddings(self.location, self.w2e.embed_mat, self.w2e.vocab)
+        if config.Embeddings.save_txt:
+            p = self.location / 'embeddings.txt'
+            with p.open('w') as f:
+                for probe, embedding in zip(self.w2e.vocab, self.w2e.embed_mat):
+                    embedding_str = ' '.join(np.around(embedding, config.Embeddings.precision).astype(str).tolist())
+                    f.write('{} {}\n'.format(probe, embedding_str))
 
     def load_w2e(self, local=False):
         runs_dir = config.LocalDirs.runs if local else config.RemoteDirs.runs
         print('Loading w2e from {}'.format(runs_dir))
-        mat = np.loadtxt(runs_dir / self.param_name / self.job_name / 'embeddings.txt',
-                         dtype='str', comments=None)
-        vocab = mat[:, 0]
-        embed_mat = mat[:, 1:].astype('float')
+        location = runs_dir / self.param_name / self.job_name
+        if not embeddings_exist(location):  # saved by previous version
+            print('Converting embeddings.txt to binary format')
+            convert_txt_embeddings(location)
+        embed_mat, vocab = load_embeddings(location)
         if not len(embed_mat) == config.Corpus.num_vocab:
             raise RuntimeError('Trying to load embeddings with vocab_size != config.Corpus.num_vocab')
         self.w2e = self.embeds_to_w2e(embed_mat, vocab)
 
+    @property
+    def vocab_sims(self):
+        """
+        lazy - similarities are computed only when vocab_sims.mat is accessed, and at most once for each w2e
+        """
+        if self._vocab_sims is None or self._vocab_sims.w2e is not self.w2e:
+            self._vocab_sims = VocabSims(self.w2e, self.vocab)
+        return self._vocab_sims
+
+    def load_neighbour_index(self, local=False, k=None):
+        """
+        nearest and farthest neighbours of all words - built once, and then loaded from run directory
+        """
+        runs_dir = config.LocalDirs.runs if local else config.RemoteDirs.runs
+        return NeighbourIndex.load_or_build(runs_dir / self.param_name / self.job_name, self.w2e, k)
+
+    def load_approx_neighbour_index(self, local=False, num_partitions=None):
+        """
+        for large vocabs - built once, and then loaded from run directory
+        """
+        runs_dir = config.LocalDirs.runs if local else config.RemoteDirs.runs
+        return ApproxNeighbourIndex.load_or_build(runs_dir / self.param_name / self.job_name, self.w2e, num_partitions)
+
     # ///////////////////////////////////////////////////////////// corpus data
 
     @cached_property
@@ -75,48 +102,47 @@ class EmbedderBase(object):
 
     @cached_property
     def docs(self):
-        hostname = socket.gethostname().lower()
-        p = self.root / '{}_{}_{}_docs.pkl'.format(hostname, config.Corpus.name, config.Corpus.num_vocab)
-        if not p.exists():
-            raise RuntimeError('{} does not exist'.format(p))
+        name = '{}_{}'.format(config.Corpus.name, config.Corpus.num_vocab)
+        if not Docs.exists(self.root, name):
+            raise RuntimeError('{} does not exist'.format(Docs.make_pointer_path(self.root, name)))
         #
-        with p.open('rb') as f:
-            res = pickle.load(f)
+        res = Docs.load(self.root, name)
         return res
 
     @cached_property
     def numeric_docs(self):
-        p = self.root / '{}_{}_numeric_docs.pkl'.format(config.Corpus.name, config.Corpus.num_vocab)
-        if not p.exists():
-            raise RuntimeError('{} does not exist'.format(p))
+        name = '{}_{}'.format(config.Corpus.name, config.Corpus.num_vocab)
+        if not NumericCorpus.exists(self.root, name):
+            raise RuntimeError('{} does not exist'.format(NumericCorpus.make_paths(self.root, name)[0]))
         #
-        with p.open('rb') as f:
-            res = pickle.load(f)
+        res = NumericCorpus.load(self.root, name)
         return res
 
     # ///////////////////////////////////////////////////////////// embeddings
 
     @staticmethod
     def w2e_to_embeds(w2e):
-        embeds = []
-        for w in w2e.keys():
-            embeds.append(w2e[w])
-        res = np.vstack(embeds)
+        res = np.asarray(w2e.embed_mat)
         if config.Eval.verbose:
             print('Converted w2e to matrix with shape {}'.format(res.shape))
         return res
 
     @staticmethod
     def embeds_to_w2e(embed_mat, vocab):
-        res = SortedDict()
-        for n, w in enumerate(vocab):
-            res[w] = embed_mat[n]
-        assert len(vocab) == len(res) == len(embed_mat)
+        """
+        rows are sorted by word - like keys of the SortedDict that w2e used to be
+        """
+        vocab = list(vocab)
+        if vocab != sorted(vocab):
+            row_ids = sorted(range(len(vocab)), key=vocab.__getitem__)
+            embed_mat = embed_mat[row_ids]
+            vocab = [vocab[i] for i in row_ids]
+        res = EmbeddingTable(embed_mat, vocab)
         return res
 
     @property
     def dim1(self):
-        res = next(iter(self.w2e.items()))[1].shape[0]
+        res = self.w2e.embed_size
         return res
 
 
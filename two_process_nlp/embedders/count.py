@@ -1,18 +1,158 @@
 import numpy as np
-from cytoolz import itertoolz
+from cached_property import cached_property
+import hashlib
+import multiprocessing as mp
 import pyprind
 import sys
+import tempfile
 import time
+from pathlib import Path
 from scipy.sparse import linalg as slinalg
 from scipy import sparse
 
 from two_process_nlp.embedders.base import EmbedderBase
+from two_process_nlp.params import CountParams
+from two_process_nlp.rsvd import randomized_svd, to_memmap, gen_row_blocks
+from two_process_nlp.atomic import atomic_path
 from two_process_nlp import config
 
-PAD = '*PAD*'
 VERBOSE = False
 
 
+def divide_rows(input_matrix, divisors):
+    """
+    divide each row of a dense or sparse matrix by its divisor - rows with a divisor of zero are set to zero
+    """
+    divisors = np.where(divisors == 0, np.inf, divisors).astype(float)
+    if sparse.issparse(input_matrix):
+        res = sparse.csr_matrix(input_matrix, dtype=float, copy=True)
+        res.data /= np.repeat(divisors, np.diff(res.indptr))
+        res.eliminate_zeros()
+        return res
+    else:
+        return input_matrix / divisors[:, np.newaxis]
+
+
+def divide_cols(input_matrix, divisors):
+    """
+    divide each column of a dense or sparse matrix by its divisor - columns with a divisor of zero are set to zero
+    """
+    divisors = np.where(divisors == 0, np.inf, divisors).astype(float)
+    if sparse.issparse(input_matrix):
+        res = sparse.csc_matrix(input_matrix, dtype=float, copy=True)
+        res.data /= np.repeat(divisors, np.diff(res.indptr))
+        res.eliminate_zeros()
+        return res.tocsr()
+    else:
+        return input_matrix / divisors[np.newaxis, :]
+
+
+def multiply_rows(input_matrix, factors):
+    if sparse.issparse(input_matrix):
+        return sparse.diags(factors).dot(input_matrix).tocsr()
+    else:
+        return input_matrix * factors[:, np.newaxis]
+
+
+def transform_nonzero(input_matrix, fun):
+    """
+    apply element-wise fun to a dense or sparse matrix - fun(0) must be 0 so that sparsity is preserved
+    """
+    if sparse.issparse(input_matrix):
+        res = sparse.csr_matrix(input_matrix, dtype=float, copy=True)
+        res.data = fun(res.data)
+        return res
+    else:
+        return fun(input_matrix.astype(float))
+
+
+def calc_ppmi(counts, row_sums, col_sums, matrix_sum):
+    """
+    positive pointwise mutual information of counts - inputs are arrays of the same (or broadcastable) shape
+    """
+    top = counts / matrix_sum
+    bottom = (row_sums / matrix_sum) * (col_sums / matrix_sum)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        div = top / bottom
+        res = np.where((counts != 0) & (bottom != 0) & (div > 1), np.log(div), 0.0)
+    return res
+
+
+def warn_zero_sums(sums, axis_name):
+    num_zeros = np.count_nonzero(sums == 0)
+    if num_zeros:
+        print('    Warning: {} {} had sum of zero. Setting prob to 0'.format(num_zeros, axis_name))
+
+
+def make_ternary_vectors(num_vectors, length, num_nonzero, random_state):
+    """
+    sparse random index vectors - each has num_nonzero randomly placed entries of +1 or -1
+    """
+    num_nonzero = min(num_nonzero, length)
+    cols = np.argsort(random_state.rand(num_vectors, length), axis=1)[:, :num_nonzero].ravel()
+    rows = np.repeat(np.arange(num_vectors), num_nonzero)
+    values = random_state.choice([-1.0, 1.0], size=num_vectors * num_nonzero)
+    res = sparse.csr_matrix((values, (rows, cols)), shape=(num_vectors, length))
+    return res
+
+
+def count_ww(token_ids, doc_ids, num_vocab, window_size, window_weight, verbose=False):
+    """
+    forward co-occurrence counts - one vectorized pass per window distance
+    """
+    count_matrix = sparse.csr_matrix((num_vocab, num_vocab), dtype=np.int64)
+    pbar = pyprind.ProgBar(window_size, stream=sys.stdout) if verbose else None
+    for dist in range(window_size):
+        # pair each token with the token (dist + 1) positions to its right - co-occurrences do not cross docs
+        shift = dist + 1
+        is_same_doc = doc_ids[:-shift] == doc_ids[shift:]
+        t1_ids = token_ids[:-shift][is_same_doc]
+        t2_ids = token_ids[shift:][is_same_doc]
+        if window_weight == "linear":
+            weight = window_size - dist
+        elif window_weight == "flat":
+            weight = 1
+        else:
+            raise AttributeError('Invalid arg to "window_weight".')
+        # increment - duplicate (t1_id, t2_id) entries are summed when converting to csr
+        weights = np.full(len(t1_ids), weight, dtype=np.int64)
+        count_matrix += sparse.coo_matrix((weights, (t1_ids, t2_ids)), shape=(num_vocab, num_vocab)).tocsr()
+        if VERBOSE:
+            print('distance {:>3}: {} co-occurrences with weight {}'.format(shift, len(t1_ids), weight))
+        if verbose:
+            pbar.update()
+    return count_matrix
+
+
+def count_ww_shard(token_ids_p, start, stop, doc_lengths, num_vocab, window_size, window_weight):
+    token_ids = np.load(str(token_ids_p), mmap_mode='r')[start:stop]
+    doc_ids = np.repeat(np.arange(len(doc_lengths)), doc_lengths)
+    return count_ww(token_ids, doc_ids, num_vocab, window_size, window_weight)
+
+
+def make_shard_bounds(doc_offsets, num_shards):
+    """
+    token positions that split corpus into num_shards similarly sized shards - shards only end at doc boundaries
+    """
+    doc_starts = np.unique(doc_offsets)
+    targets = np.linspace(0, doc_offsets[-1], num_shards + 1)
+    res = np.unique(doc_starts[np.searchsorted(doc_starts, targets)])
+    return res.tolist()
+
+
+def get_shard_doc_lengths(doc_offsets, start, stop):
+    shard_doc_offsets = doc_offsets[(doc_offsets >= start) & (doc_offsets <= stop)]
+    return np.diff(shard_doc_offsets)
+
+
+def sum_rows(input_matrix):
+    return np.asarray(input_matrix.sum(axis=1)).ravel()
+
+
+def sum_cols(input_matrix):
+    return np.asarray(input_matrix.sum(axis=0)).ravel()
+
+
 class CountEmbedder(EmbedderBase):
     def __init__(self, param2val):
         super().__init__(param2val['param_name'], param2val['job_name'])
@@ -24,46 +164,57 @@ class CountEmbedder(EmbedderBase):
 
     # ////////////////////////////////////////////////// word-by-word
 
-    def create_ww_matrix_fast(self):  # no function call overhead - twice as fast
+    def count_ww_matrix(self, window_size, window_weight):
+        """
+        forward counts only - window_type is applied afterwards, so that all window types can share cached counts
+        """
+        num_vocab = len(self.vocab)
+        token_ids = self.numeric_docs.token_ids
+        doc_offsets = np.asarray(self.numeric_docs.doc_offsets)
+        num_workers = min(config.Count.num_count_workers, len(self.numeric_docs))
+        print('\nCounting word-word co-occurrences in {}-word moving window'.format(window_size))
+        if num_workers <= 1:
+            return count_ww(token_ids, self.numeric_docs.doc_ids, num_vocab, window_size, window_weight, verbose=True)
+        # count shards in separate processes - shards only end at doc boundaries, so no co-occurrence is lost
+        print('Counting {} shards in {} worker processes'.format(num_workers, num_workers))
+        shard_bounds = make_shard_bounds(doc_offsets, num_workers)
+        count_matrix = sparse.csr_matrix((num_vocab, num_vocab), dtype=np.int64)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # workers memory-map tokens instead of receiving copies - no need to save tokens if already on disk
+            if isinstance(token_ids, np.memmap):
+                token_ids_p = Path(token_ids.filename)
+            else:
+                token_ids_p = Path(tmp_dir) / 'token_ids.npy'
+                np.save(str(token_ids_p), token_ids)
+            pool = mp.Pool(processes=num_workers)
+            results = [pool.apply_async(count_ww_shard, args=(
+                token_ids_p, start, stop, get_shard_doc_lengths(doc_offsets, start, stop),
+                num_vocab, window_size, window_weight))
+                       for start, stop in zip(shard_bounds[:-1], shard_bounds[1:])]
+            try:
+                for res in results:
+                    count_matrix += res.get()
+            finally:
+                pool.close()
+                pool.join()
+        return count_matrix
+
+    def create_ww_matrix_fast(self):
         window_type = self.count_type[1]
         window_size = self.count_type[2]
         window_weight = self.count_type[3]
         # count
-        num_docs = len(self.numeric_docs)
-        num_vocab = len(self.vocab)
-        pbar = pyprind.ProgBar(num_docs, stream=sys.stdout)
-        count_matrix = np.zeros([num_vocab, num_vocab], int)
-        print('\nCounting word-word co-occurrences in {}-word moving window'.format(window_size))
-        for token_ids in self.numeric_docs:
-            token_ids += [PAD] * window_size  # add padding such that all co-occurrences in last window are captured
-            if VERBOSE:
-                print(token_ids)
-            windows = itertoolz.sliding_window(window_size + 1, token_ids)  # + 1 because window consists of t2s only
-            for w in windows:
-                for t1_id, t2_id, dist in zip([w[0]] * window_size,
-                                              w[1:],
-                                              range(window_size)):
-                    # increment
-                    if t1_id == PAD or t2_id == PAD:
-                        continue
-                    if window_weight == "linear":
-                        count_matrix[t1_id, t2_id] += window_size - dist
-                    elif window_weight == "flat":
-                        count_matrix[t1_id, t2_id] += 1
-                    if VERBOSE:
-                        print('row {:>3} col {:>3} set to {}'.format(t1_id, t2_id, count_matrix[t1_id, t2_id]))
-            if VERBOSE:
-                print()
-            pbar.update()
+        count_matrix = self.load_or_count('ww_{}_{}'.format(window_size, window_weight),
+                                          lambda: self.count_ww_matrix(window_size, window_weight))
         # window_type
         if window_type == 'forward':
             final_matrix = count_matrix
         elif window_type == 'backward':
-            final_matrix = count_matrix.transpose()
+            final_matrix = count_matrix.transpose().tocsr()
         elif window_type == 'summed':
-            final_matrix = count_matrix + count_matrix.transpose()
+            final_matrix = count_matrix + count_matrix.transpose().tocsr()
         elif window_type == 'concatenated':
-            final_matrix = np.concatenate((count_matrix, count_matrix.transpose()), axis=1)
+            final_matrix = sparse.hstack((count_matrix, count_matrix.transpose()), format='csr')
         else:
             raise AttributeError('Invalid arg to "window_type".')
         print('Shape of normalized matrix={}'.format(final_matrix.shape))
@@ -72,17 +223,50 @@ class CountEmbedder(EmbedderBase):
     # ////////////////////////////////////////////////// word-by-document
 
     def create_wd_matrix(self):
-        # count
+        # count - duplicate (token_id, doc_id) entries are summed when converting to csr
         num_docs = len(self.numeric_docs)
-        pbar = pyprind.ProgBar(num_docs, stream=sys.stdout)
-        count_matrix = np.zeros([config.Corpus.num_vocab, num_docs], int)
+        num_vocab = len(self.vocab)
         print('\nCounting word occurrences in {} documents'.format(num_docs))
-        for i in range(num_docs):
-            for j in self.numeric_docs[i]:
-                count_matrix[j, i] += 1
-            pbar.update()
+        token_ids = self.numeric_docs.token_ids
+        counts = np.ones(len(token_ids), dtype=np.int64)
+        count_matrix = sparse.coo_matrix((counts, (token_ids, self.numeric_docs.doc_ids)),
+                                         shape=(num_vocab, num_docs)).tocsr()
         return count_matrix
 
+    # ////////////////////////////////////////////////// count cache
+
+    @cached_property
+    def numeric_docs_hash(self):
+        h = hashlib.sha1(np.asarray(self.numeric_docs.token_ids, dtype=np.int32).tobytes())
+        # same tokens split into different docs result in different counts
+        h.update(np.asarray(self.numeric_docs.doc_offsets, dtype=np.int64).tobytes())
+        res = h.hexdigest()
+        return res
+
+    def make_cache_path(self, cache_name, key):
+        cache_dir = self.root / cache_name
+        if not cache_dir.exists():
+            cache_dir.mkdir(parents=True)
+        res = cache_dir / '{}_{}_{}_{}.npz'.format(
+            config.Corpus.name, config.Corpus.num_vocab, key, self.numeric_docs_hash)
+        return res
+
+    def load_or_count(self, count_name, count):
+        """
+        raw counts depend only on corpus data and count_type - re-use them across norm_type and reduce_type
+        """
+        if not config.Count.cache_count_matrices:
+            return sparse.csr_matrix(count())
+        p = self.make_cache_path('count_matrices', count_name)
+        if p.exists():
+            print('Loading cached count matrix from {}'.format(p))
+            return sparse.load_npz(str(p)).tocsr()
+        res = sparse.csr_matrix(count())
+        with atomic_path(p) as tmp_p, tmp_p.open('wb') as f:  # concurrent jobs never read a partial file
+            sparse.save_npz(f, res)
+        print('Saved count matrix to {}'.format(p))
+        return res
+
     # ////////////////////////////////////////////////// train
 
     def train(self):
@@ -91,13 +275,25 @@ class CountEmbedder(EmbedderBase):
         if self.count_type[0] == 'ww':
             count_matrix = self.create_ww_matrix_fast()
         elif self.count_type[0] == 'wd':
-            count_matrix = self.create_wd_matrix()
+            count_matrix = self.load_or_count('wd', self.create_wd_matrix)
         else:
             raise AttributeError('Invalid arg to "count_type".')
         print('Completed count in {}'.format(time.time() - start))
         # normalize + reduce
         norm_matrix, dimensions = self.normalize(count_matrix, self.norm_type)
-        reduced_matrix, dimensions = self.reduce(norm_matrix, self.reduce_type[0], self.reduce_type[1])
+        del count_matrix  # not needed anymore - and may be large
+        norm_matrix_key = '_'.join([str(v) for v in self.count_type + [self.norm_type]])
+        if self.reduce_type[0] == 'rsvd' and config.Count.rsvd_memmap:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                # in-memory matrix is freed - randomized svd streams row blocks from disk
+                norm_matrix = to_memmap(norm_matrix, Path(tmp_dir))
+                reduced_matrix, dimensions = self.reduce(norm_matrix, self.reduce_type[0], self.reduce_type[1],
+                                                         *self.reduce_type[2:], cache_key=norm_matrix_key)
+        else:
+            reduced_matrix, dimensions = self.reduce(norm_matrix, self.reduce_type[0], self.reduce_type[1],
+                                                     *self.reduce_type[2:], cache_key=norm_matrix_key)
+        if sparse.issparse(reduced_matrix):  # only without reduction
+            reduced_matrix = reduced_matrix.toarray()
         # to w2e
         self.w2e = self.embeds_to_w2e(reduced_matrix, self.vocab)
         return reduced_matrix  # for unittest
@@ -125,118 +321,62 @@ class CountEmbedder(EmbedderBase):
 
     def norm_rowsum(self, input_matrix):
         print('\nNormalizing matrix by row sums...')
-        num_rows = len(input_matrix[:,0])
-        num_cols = len(input_matrix[0,:])
-        output_matrix = np.zeros([num_rows, num_cols], float)
-        pbar = pyprind.ProgBar(num_rows, stream=sys.stdout)
-        for i in range(num_rows):
-            if input_matrix[i,:].sum() == 0:
-                print('    Warning: Row {} ({}) had sum of zero. Setting prob to 0'.format(i, self.vocab[i]))
-            else:
-                output_matrix[i,:] = input_matrix[i,:] / input_matrix[i,:].sum()
-            pbar.update()
-        return output_matrix, num_cols
+        row_sums = sum_rows(input_matrix)
+        warn_zero_sums(row_sums, 'rows')
+        output_matrix = divide_rows(input_matrix, row_sums)
+        return output_matrix, input_matrix.shape[1]
 
     def norm_colsum(self, input_matrix):
         print('\nNormalizing matrix by column sums...')
-        num_rows = len(input_matrix[:,0])
-        num_cols = len(input_matrix[0,:])
-        output_matrix = np.zeros([num_rows, num_cols], float)
-        pbar = pyprind.ProgBar(num_cols, stream=sys.stdout)
-        for i in range(num_cols):
-            if input_matrix[:,i].sum() == 0:
-                print('    Warning: Column {} had sum of zero. Setting prob to 0'.format(i, self.vocab[i]))
-            else:
-                output_matrix[:,i] = input_matrix[:,i] / input_matrix[:,i].sum()
-            pbar.update()
-        return output_matrix, num_cols
+        col_sums = sum_cols(input_matrix)
+        warn_zero_sums(col_sums, 'columns')
+        output_matrix = divide_cols(input_matrix, col_sums)
+        return output_matrix, input_matrix.shape[1]
 
     def norm_tfidf(self, input_matrix):
         print('\nNormalizing matrix by tf-idf...')
-        num_rows = len(input_matrix[:,0])
-        num_cols = len(input_matrix[0,:])
-        print('Calculating column probs')
-        pbar = pyprind.ProgBar(num_cols, stream=sys.stdout)
-        colprob_matrix = np.zeros([num_rows, num_cols], float)
-        for i in range(num_cols):
-            if input_matrix[:,i].sum() == 0:
-                print('    Warning: Column {} had sum of zero. Setting prob to 0'.format(i, self.vocab[i]))
-            else:
-                colprob_matrix[:,i] = input_matrix[:,i] / input_matrix[:,i].sum()
-            pbar.update()
-        print('Calculating tf-idf scores')
-        output_matrix = np.zeros([num_rows, num_cols], float)
-        pbar = pyprind.ProgBar(num_rows, stream=sys.stdout)
-        for i in range(num_rows):
-            col_occ_count = np.count_nonzero(input_matrix[i,:]) + 1
-            row_idf = float(num_cols) / col_occ_count
-            for j in range(num_cols):
-                output_matrix[i,j] = colprob_matrix[i,j] / row_idf
-            pbar.update()
+        num_cols = input_matrix.shape[1]
+        col_sums = sum_cols(input_matrix)
+        warn_zero_sums(col_sums, 'columns')
+        colprob_matrix = divide_cols(input_matrix, col_sums)
+        col_occ_counts = sum_rows(input_matrix != 0) + 1
+        row_idfs = num_cols / col_occ_counts
+        output_matrix = divide_rows(colprob_matrix, row_idfs)
         return output_matrix, num_cols
 
     def norm_ppmi(self, input_matrix):
         print('\nNormalizing matrix by ppmi')
-        num_rows = len(input_matrix[:,0])
-        num_cols = len(input_matrix[0,:])
-
-        row_sums = input_matrix.sum(1)
-        col_sums = input_matrix.sum(0)
+        row_sums = sum_rows(input_matrix)
+        col_sums = sum_cols(input_matrix)
         matrix_sum = row_sums.sum()
-
-        output_matrix = np.zeros([num_rows, num_cols], float)
-        pbar = pyprind.ProgBar(num_rows, stream=sys.stdout)
-        for i in range(num_rows):
-            for j in range(num_cols):
-                if input_matrix[i, j] == 0:
-                    output_matrix[i, j] = 0
-                elif (row_sums[i] == 0) or (col_sums[j] == 0):
-                    output_matrix[i, j] = 0
-                else:
-                    top = input_matrix[i, j] / matrix_sum
-                    bottom = (row_sums[i] / matrix_sum) * (col_sums[j] / matrix_sum)
-                    div = top/bottom
-                    if div <= 1:
-                        output_matrix[i, j] = 0
-                    else:
-                        output_matrix[i, j] = np.log(div)
-            pbar.update()
-        return output_matrix, num_cols
+        if sparse.issparse(input_matrix):  # only non-zero cells can have positive pmi
+            coo = input_matrix.tocoo()
+            ppmis = calc_ppmi(coo.data, row_sums[coo.row], col_sums[coo.col], matrix_sum)
+            output_matrix = sparse.csr_matrix((ppmis, (coo.row, coo.col)), shape=input_matrix.shape)
+            output_matrix.eliminate_zeros()
+        else:
+            output_matrix = calc_ppmi(input_matrix, row_sums[:, np.newaxis], col_sums[np.newaxis, :], matrix_sum)
+        return output_matrix, input_matrix.shape[1]
 
     def row_logentropy(self, input_matrix):
         print('\nNormalizing matrix by log entropy')
-        num_rows = len(input_matrix[:,0])
-        num_cols = len(input_matrix[0,:])
-        output_matrix = np.zeros([num_rows, num_cols], float)
-
-        print('Computing row probabilities')
-        row_prob_matrix = np.zeros([num_rows, num_cols], float)
-        pbar = pyprind.ProgBar(num_rows, stream=sys.stdout)
-        for i in range(num_rows):
-            if input_matrix[i,:].sum() == 0:
-                print('    Warning: Row {} ({}) had sum of zero. Setting prob to 0'.format(i, self.vocab[i]))
-            else:
-                row_prob_matrix[i,:] = input_matrix[i,:] / input_matrix[i,:].sum()
-            pbar.update()
-
-        print('Computing entropy scores')
-        log_freqs = np.log(input_matrix + 1)
-        pbar = pyprind.ProgBar(num_rows, stream=sys.stdout)
-        for i in range(num_rows):
-            row_entropy = np.dot(row_prob_matrix[i, :], np.log(row_prob_matrix[i, :] + 1))
-            global_weight = 1 + (row_entropy / np.log(num_cols + 1))
-
-            for j in range(num_cols):
-                output_matrix[i, j] = log_freqs[i, j] * global_weight
-            pbar.update()
-
+        num_cols = input_matrix.shape[1]
+        row_sums = sum_rows(input_matrix)
+        warn_zero_sums(row_sums, 'rows')
+        row_prob_matrix = divide_rows(input_matrix, row_sums)
+        row_entropies = sum_rows(transform_nonzero(row_prob_matrix, lambda p: p * np.log(p + 1)))
+        global_weights = 1 + (row_entropies / np.log(num_cols + 1))
+        log_freqs = transform_nonzero(input_matrix, lambda f: np.log(f + 1))
+        output_matrix = multiply_rows(log_freqs, global_weights)
         return output_matrix, num_cols
 
     # ////////////////////////////////////////////////// reductions
 
-    def reduce(self, input_matrix, reduce_type, reduce_size):
+    def reduce(self, input_matrix, reduce_type, reduce_size, weight_power=0, cache_key=None):
         if reduce_type == 'svd':
-            reduced_matrix, dimensions = self.reduce_svd(input_matrix, reduce_size)
+            reduced_matrix, dimensions = self.reduce_svd(input_matrix, reduce_size, weight_power, cache_key)
+        elif reduce_type == 'rsvd':
+            reduced_matrix, dimensions = self.reduce_rsvd(input_matrix, reduce_size, weight_power, cache_key)
         elif reduce_type == 'rva':
             reduced_matrix, dimensions = self.reduce_rva(input_matrix, reduce_size)
         elif reduce_type is None:
@@ -244,28 +384,87 @@ class CountEmbedder(EmbedderBase):
             dimensions = input_matrix.shape[1]
         else:
             raise AttributeError("Improper matrix reduction type '{}'. "
-                                 "Must be 'svd', 'rva', or 'none'".format(reduce_type))
+                                 "Must be 'svd', 'rsvd', 'rva', or 'none'".format(reduce_type))
         return reduced_matrix, dimensions
 
-    def reduce_svd(self, input_matrix, dimensions):
+    def reduce_svd(self, input_matrix, dimensions, weight_power=0, cache_key=None):
         print('\nReducing matrix using SVD to {} singular values'.format(dimensions))
-        # u, s, v = np.linalg.svd(input_matrix)
-        sparse_cooc_mat = sparse.csr_matrix(input_matrix).asfptype()
-        u, s, v = slinalg.svds(sparse_cooc_mat, k=dimensions)
+        u, s = self.load_or_decompose(input_matrix, dimensions, cache_key)
+        # leading components of a larger decomposition are the same as those of a decomposition of this size
+        reduced_matrix = u[:, :dimensions] * (s[:dimensions] ** weight_power)  # weight_power=0 returns u
+        return reduced_matrix, dimensions
 
-        reduced_matrix = u[:, 0:dimensions]
+    def reduce_rsvd(self, input_matrix, dimensions, weight_power=0, cache_key=None):
+        print('\nReducing matrix using randomized SVD to {} singular values'.format(dimensions))
+        if cache_key is not None:  # decomposition depends on accuracy settings
+            cache_key += '_rsvd_{}_{}'.format(config.Count.rsvd_num_oversamples, config.Count.rsvd_num_power_iterations)
+        u, s = self.load_or_decompose(input_matrix, dimensions, cache_key, reduce_name='rsvd')
+        reduced_matrix = u[:, :dimensions] * (s[:dimensions] ** weight_power)
         return reduced_matrix, dimensions
 
+    def load_or_decompose(self, input_matrix, dimensions, cache_key, reduce_name='svd'):
+        """
+        a single svd at the largest size in CountParams.reduce_type serves all smaller sizes
+        """
+        decompose = self.decompose if reduce_name == 'svd' else self.decompose_randomized
+        if cache_key is None or not config.Count.cache_svds:
+            u, s, vt = decompose(input_matrix, dimensions)
+            return u, s
+        p = self.make_cache_path('svds', cache_key)
+        if p.exists():
+            with np.load(str(p)) as npz:
+                u, s = npz['u'], npz['s']
+            if len(s) >= dimensions:
+                print('Loaded cached SVD with {} singular values from {}'.format(len(s), p))
+                return u, s
+        max_rank = max([reduce_type[1] for reduce_type in CountParams.reduce_type if reduce_type[0] == reduce_name] +
+                       [dimensions])
+        u, s, vt = decompose(input_matrix, max_rank)
+        with atomic_path(p) as tmp_p, tmp_p.open('wb') as f:
+            np.savez(f, u=u, s=s, vt=vt)
+        print('Saved SVD with {} singular values to {}'.format(len(s), p))
+        return u, s
+
+    @staticmethod
+    def decompose(input_matrix, rank):
+        rank = max(1, min(rank, min(input_matrix.shape) - 1))  # svds requires rank < min(shape)
+        sparse_cooc_mat = sparse.csr_matrix(input_matrix).asfptype()  # no copy if input is sparse float matrix
+        u, s, vt = slinalg.svds(sparse_cooc_mat, k=rank)
+        # svds returns singular values in ascending order
+        order = np.argsort(s)[::-1]
+        return u[:, order], s[order], vt[order]
+
+    @staticmethod
+    def decompose_randomized(input_matrix, rank):
+        start = time.time()
+        rank = max(1, min(rank, min(input_matrix.shape)))
+        # input_matrix may be memory-mapped (see train) - it is only accessed one block of rows at a time
+        u, s, vt, error = randomized_svd(input_matrix, rank, config.Count.rsvd_num_oversamples,
+                                         config.Count.rsvd_num_power_iterations, config.Count.rsvd_block_size)
+        print('Randomized SVD with {} oversamples and {} power iterations: '
+              'relative reconstruction error={:.4f} in {:.1f} secs'.format(
+                config.Count.rsvd_num_oversamples, config.Count.rsvd_num_power_iterations, error, time.time() - start))
+        return u, s, vt
+
     def reduce_rva(self, input_matrix, length, mean=0, stdev=1):
         print('\nReducing matrix using RVA')
-        num_rows = len(input_matrix[:, 0])
-        num_cols = len(input_matrix[0, :])
-        random_vectors = np.random.normal(mean,stdev,[num_rows, length])
+        num_rows, num_cols = input_matrix.shape
+        # one random vector per column (context)
+        random_state = np.random.RandomState(config.Count.rva_seed)
+        if config.Count.rva_vector_type == 'normal':
+            random_vectors = random_state.normal(mean, stdev, [num_cols, length])
+        elif config.Count.rva_vector_type == 'ternary':
+            random_vectors = make_ternary_vectors(num_cols, length, config.Count.rva_num_nonzero, random_state)
+        else:
+            raise AttributeError('Invalid arg to "rva_vector_type".')
+        # accumulate random vectors weighted by counts - chunks of rows keep memory bounded
         rva_matrix = np.zeros([num_rows, length], float)
-        pbar = pyprind.ProgBar(num_rows, stream=sys.stdout)
-        for i in range(num_rows):
-            for j in range(num_rows):
-                rva_matrix[i,:] += (input_matrix[i,j]*random_vectors[j,:])
+        block_size = config.Count.rva_block_size
+        pbar = pyprind.ProgBar(int(np.ceil(num_rows / block_size)), stream=sys.stdout)
+        for start, stop, block in gen_row_blocks(input_matrix, block_size):
+            if sparse.issparse(random_vectors):
+                rva_matrix[start:stop] = sparse.csr_matrix(block).dot(random_vectors).toarray()
+            else:
+                rva_matrix[start:stop] = block.dot(random_vectors)
             pbar.update()
-
-        return rva_matrix, length
\ No newline at end of file
+        return rva_matrix, length
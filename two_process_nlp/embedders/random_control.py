@@ -13,8 +13,9 @@ class RandomControlEmbedder(EmbedderBase):
 
     def train(self):
         if self.random_type == 'normal':
-            self.w2e = {w: np.random.normal(0, 1.0, self.embed_size) for w in self.vocab}
+            embed_mat = np.random.normal(0, 1.0, (len(self.vocab), self.embed_size))
         elif self.random_type == 'uniform':
-            self.w2e = {w: np.random.uniform(-1.0, 1.0, self.embed_size) for w in self.vocab}
+            embed_mat = np.random.uniform(-1.0, 1.0, (len(self.vocab), self.embed_size))
         else:
             raise NotImplementedError
+        self.w2e = self.embeds_to_w2e(embed_mat, self.vocab)
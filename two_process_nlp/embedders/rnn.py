@@ -70,7 +70,7 @@ class RNNEmbedder(EmbedderBase):
         self.model.batch_size = 1  # TODO find batch size that excludes least samples
         errors = 0
         batch_id = 0
-        token_ids = np.hstack(numeric_docs)
+        token_ids = np.hstack(numeric_docs).astype(np.int64)  # docs are int32 views into numeric corpus
         num_windows = len(token_ids)
         pbar = pyprind.ProgBar(num_windows, stream=sys.stdout)
         for batch_id, x_b, y_b in self.gen_batches(token_ids, self.model.batch_size, verbose=False):
@@ -93,7 +93,7 @@ class RNNEmbedder(EmbedderBase):
         # shuffle and flatten
         if self.shuffle_per_epoch:
             np.random.shuffle(numeric_docs)
-        token_ids = np.hstack(numeric_docs)
+        token_ids = np.hstack(numeric_docs).astype(np.int64)  # docs are int32 views into numeric corpus
         for batch_id, x_b, y_b in self.gen_batches(token_ids, self.model.batch_size, verbose):
             # forward step
             inputs = torch.cuda.LongTensor(x_b.T)  # requires [num_steps, mb_size]
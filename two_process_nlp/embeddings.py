@@ -0,0 +1,129 @@
+import numpy as np
+from cached_property import cached_property
+from collections.abc import Mapping
+
+from two_process_nlp.atomic import atomic_path
+
+
+class EmbeddingTable(Mapping):
+    """
+    all embeddings in one contiguous matrix (rows in the order of vocab), and an index from word to row.
+    can be used like the dict w2e used to be, but embeddings of many words are gathered in a single step
+    """
+    def __init__(self, embed_mat, vocab):
+        self.embed_mat = embed_mat
+        self.vocab = list(vocab)
+        self.w2id = {w: n for n, w in enumerate(self.vocab)}
+        assert len(self.vocab) == len(self.w2id) == len(embed_mat)
+
+    @property
+    def embed_size(self):
+        return self.embed_mat.shape[1]
+
+    @cached_property
+    def normalized(self):
+        """
+        float32 embeddings with unit length - dot products of rows are cosine similarities
+        """
+        res = np.array(self.embed_mat, dtype=np.float32)
+        norms = np.linalg.norm(res, axis=1, keepdims=True)
+        norms[norms == 0] = 1  # similarities of zero vectors are zero
+        res /= norms
+        return res
+
+    def ids(self, words):
+        """
+        row ids with the same shape as words - words may be nested, e.g. a matrix of candidates
+        """
+        words_array = np.asarray(words)
+        res = np.array([self.w2id[w] for w in words_array.ravel().tolist()], dtype=np.int64)
+        return res.reshape(words_array.shape)
+
+    def rows(self, ids):
+        return np.asarray(self.embed_mat[ids])
+
+    def gather(self, words):
+        """
+        embeddings of words - with shape words.shape + (embed_size,)
+        """
+        return self.rows(self.ids(words))
+
+    # ///////////////////////////////////////////////////////////// mapping
+
+    def __getitem__(self, w):
+        return self.embed_mat[self.w2id[w]]
+
+    def __contains__(self, w):
+        return w in self.w2id
+
+    def __iter__(self):
+        return iter(self.vocab)
+
+    def __len__(self):
+        return len(self.vocab)
+
+
+class VocabSims(object):
+    """
+    cosine similarities between all words in vocab - computed in float32 when mat is first accessed, then cached
+    """
+    def __init__(self, w2e, vocab):
+        self.w2e = w2e
+        self.vocab = vocab
+        self._mat = None
+
+    @property
+    def mat(self):
+        if self._mat is None:
+            print('Computing vocab similarity matrix...')
+            x = self.w2e.normalized[self.w2e.ids(self.vocab)]
+            self._mat = x.dot(x.T)
+        return self._mat
+
+
+def make_paths(location):
+    embed_mat_p = location / 'embeddings.npy'
+    vocab_p = location / 'embeddings_vocab.txt'
+    return embed_mat_p, vocab_p
+
+
+def embeddings_exist(location):
+    return all([p.exists() for p in make_paths(location)])
+
+
+def save_embeddings(location, embed_mat, vocab):
+    """
+    float32 matrix and vocab - one word per line, in the same order as rows.
+    vocab is renamed last - so a new vocab is never paired with an old matrix
+    """
+    embed_mat_p, vocab_p = make_paths(location)
+    assert len(embed_mat) == len(vocab)
+    with atomic_path(vocab_p) as tmp_vocab_p, atomic_path(embed_mat_p) as tmp_embed_mat_p:
+        with tmp_vocab_p.open('w', encoding='utf-8') as f:
+            for w in vocab:
+                f.write('{}\n'.format(w))
+        np.save(str(tmp_embed_mat_p), np.asarray(embed_mat, dtype=np.float32))
+
+
+def load_embeddings(location):
+    """
+    memory-mapped - pages are loaded only when accessed, and are shared by all processes reading the same run
+    """
+    embed_mat_p, vocab_p = make_paths(location)
+    embed_mat = np.load(str(embed_mat_p), mmap_mode='r')
+    with vocab_p.open('r', encoding='utf-8') as f:
+        vocab = f.read().splitlines()
+    if len(vocab) != len(embed_mat):  # saving was interrupted
+        raise RuntimeError('{} has {} words but {} has {} rows.'.format(
+            vocab_p, len(vocab), embed_mat_p, len(embed_mat)))
+    return embed_mat, vocab
+
+
+def convert_txt_embeddings(location):
+    """
+    convert embeddings.txt saved by previous versions to binary format
+    """
+    mat = np.loadtxt(str(location / 'embeddings.txt'), dtype='str', comments=None)
+    vocab = mat[:, 0].tolist()
+    embed_mat = mat[:, 1:].astype(np.float32)
+    save_embeddings(location, embed_mat, vocab)
@@ -1,10 +1,10 @@
 import multiprocessing as mp
 import numpy as np
 import sys
-from sortedcontainers import SortedDict
 from sklearn import preprocessing
 
 from two_process_nlp import config
+from two_process_nlp.embeddings import EmbeddingTable
 from two_process_nlp.params import make_param2val_list, ObjectView
 
 
@@ -73,7 +73,7 @@ class EvalBase(object):
 
     # ////////////////////////////////////////////////////// evaluator-specific
 
-    def make_all_eval_data(self, vocab_sims_mat, vocab):
+    def make_all_eval_data(self, vocab_sims, vocab):  # vocab_sims.mat is computed only if accessed
         raise NotImplementedError('Must be implemented in child-class.')
 
     def check_negative_example(self, trial, p=None, c=None):
@@ -180,21 +180,14 @@ class EvalBase(object):
 
     @staticmethod
     def standardize_w2e(w2e):
-        # to embed_mat
-        embeds = []
-        for w in w2e.keys():
-            embeds.append(w2e[w])
-        mat = np.vstack(embeds)
+        mat = w2e.embed_mat
         print('mean before standardization={}'.format(mat.mean()))
         #
         scaler = preprocessing.StandardScaler()
         standardized_mat = scaler.fit_transform(mat)
         print('mean after standardization={}'.format(standardized_mat.mean()))
         # back to w2e
-        res = SortedDict()
-        vocab = sorted(w2e.keys())
-        for n, w in enumerate(vocab):
-            res[w] = standardized_mat[n]
+        res = EmbeddingTable(standardized_mat, w2e.vocab)
         return res
 
     def do_trial(self, trial, w2e, embed_size, embedder_location, shuffled):
@@ -36,9 +36,9 @@ class Identification(EvalBase):
 
     # ///////////////////////////////////////////// Overwritten Methods START
 
-    def make_all_eval_data(self, vocab_sims_mat, vocab, verbose=False):
+    def make_all_eval_data(self, vocab_sims, vocab, verbose=False):
         """
-        actual evaluation data is sampled from result of this method
+        actual evaluation data is sampled from result of this method - vocab_sims is not used
         """
 
         def sample_candidates(name, population, num):
@@ -135,13 +135,12 @@ class Identification(EvalBase):
             'at epoch={}'.format(num_epochs) if num_epochs is not None else ''))
 
     def to_eval_sims_mat(self, sims_mat):
-        res = np.full_like(self.eval_candidates_mat, np.nan, dtype=float)
-        for i, candidates_row in enumerate(self.eval_candidates_mat):
-            eval_probe = self.row_words[i]
-            for j, candidate in enumerate(candidates_row):
-                row_id = self.row_words.index(eval_probe)  # can use .index() because duplicate sim rows are identical
-                col_id = self.col_words.index(candidate)
-                res[i, j] = sims_mat[row_id, col_id]
+        # first occurrence of each word - like .index(), which is fine because duplicate sim rows are identical
+        rw2row_id = {w: n for n, w in reversed(list(enumerate(self.row_words)))}
+        cw2col_id = {w: n for n, w in reversed(list(enumerate(self.col_words)))}
+        row_ids = np.array([rw2row_id[w] for w in self.row_words[:len(self.eval_candidates_mat)]])
+        col_ids = np.array([[cw2col_id[c] for c in candidates_row] for candidates_row in self.eval_candidates_mat])
+        res = np.asarray(sims_mat[row_ids[:, np.newaxis], col_ids], dtype=float)
         return res
 
     # ///////////////////////////////////////// Overwritten Methods END
@@ -1,9 +1,7 @@
+import numpy as np
 import pandas as pd
 import sys
-from collections import Counter, OrderedDict
-from itertools import islice
-import pyprind
-from spacy.lang.en import English
+from collections import OrderedDict
 
 from two_process_nlp import config
 from two_process_nlp.aggregator import Aggregator
@@ -14,60 +12,107 @@ from two_process_nlp.utils import init_embedder
 from two_process_nlp.utils import w2e_to_sims
 from two_process_nlp.utils import save_corpus_data
 from two_process_nlp.utils import move_scores_to_server, save_param2val
+from two_process_nlp.preprocessing import gen_texts, gen_encoded_chunks, reduce_chunk, hash_corpus, ends_with_newline
+from two_process_nlp.preprocessing import verify_whitespace_tokenizer, make_vocab
+from two_process_nlp.preprocessing import load_manifest, save_manifest, load_type_data, save_type_data, load_vocab
+from two_process_nlp.corpus import NumericCorpus, NumericCorpusWriter
 
 
-nlp = English()
-
-
-def preprocessing_job(num_vocab=None, skip_docs=False, local=False):
-    num_vocab = num_vocab or config.Corpus.num_vocab
-    print('Preprocessing data using vocab_size={}'.format(num_vocab))
-    #
-    docs = []
-    w2freq = Counter()
-    # tokenize + count words
+def preprocessing_job(num_vocabs=None, skip_docs=False, local=False, incremental=False):
+    """
+    tokenize + count corpus once, and save vocab and numeric docs for each vocab size in num_vocabs.
+    if incremental, only lines appended to the corpus since the last run are tokenized
+    """
+    num_vocabs = num_vocabs or [config.Corpus.num_vocab]
+    print('Preprocessing data using vocab_sizes={}'.format(num_vocabs))
+    root = config.LocalDirs.root if local else config.RemoteDirs.root
+    types_name = '{}_types'.format(config.Corpus.name)  # type ids of all tokens - independent of vocab size
     p = config.LocalDirs.corpora / '{}.txt'.format(config.Corpus.name)
-    with p.open('r') as f:
-        texts = f.read().splitlines()  # removes '\n' newline character
-    num_texts = len(texts)
-    print('\nTokenizing {} docs...'.format(num_texts))
-    pbar = pyprind.ProgBar(num_texts, stream=sys.stdout)
-    for text in texts:
-        spacy_doc = nlp(text)
-        doc = [w.text for w in spacy_doc]
-        docs.append(doc)
-        c = Counter(doc)
-        w2freq.update(c)
-        pbar.update()
-    # vocab
-    deterministic_w2f = OrderedDict(sorted(w2freq.items(), key=lambda item: (item[1], item[0]), reverse=True))
-    if num_vocab is None:
-        vocab = list(deterministic_w2f.keys())
+    corpus_size = p.stat().st_size
+    # resume from last run - only if corpus was appended to since
+    manifest = load_manifest(root, config.Corpus.name) if incremental else None
+    if manifest is not None:
+        old_stop = manifest['ranges'][-1][1]
+        corpus_hash = hash_corpus(p, 0, old_stop) if old_stop <= corpus_size else None
+        if corpus_hash is None or manifest.get('sha1') != corpus_hash.hexdigest():
+            print('Corpus changed since last run. Preprocessing whole corpus')
+            manifest = None
+        elif not manifest['ends_with_newline'] and corpus_size > old_stop:
+            # appended bytes continue the last doc - which cannot be removed from the counts
+            print('Last line of corpus was unfinished in last run. Preprocessing whole corpus')
+            manifest = None
+        elif not NumericCorpus.exists(root, types_name) \
+                or len(NumericCorpus.load(root, types_name)) != manifest['num_docs']:
+            print('Preprocessed data changed since last run. Preprocessing whole corpus')
+            manifest = None
+    if manifest is not None:
+        start = manifest['ranges'][-1][1]
+        tokenizer = manifest['tokenizer']
+        types, type_counts = load_type_data(root, config.Corpus.name)
+        print('Preprocessing bytes {}-{} of corpus'.format(start, corpus_size))
     else:
-        vocab = list(islice(deterministic_w2f.keys(), 0, num_vocab - 1))
-        vocab.append(config.Corpus.UNK)
-    vocab = list(sorted(vocab))
-    if num_vocab is None:  # if no vocab specified, use the whole corpus
+        start = 0
+        corpus_hash = None
+        tokenizer = config.Corpus.tokenizer
+        types = []  # by order of first occurrence
+        type_counts = np.zeros(0, dtype=np.int64)
+        manifest = {'ranges': [], 'num_docs': 0}
+    num_old_docs = manifest['num_docs']
+    # tokenizer - whitespace tokenization is much faster, but only safe if corpus is already tokenized like spacy
+    if tokenizer == 'whitespace' and config.Preprocessing.verify_tokenizer:
+        if not verify_whitespace_tokenizer(gen_texts(p, start, corpus_size)):
+            if num_old_docs:
+                raise RuntimeError('New lines are not tokenized like spacy. Preprocess whole corpus instead.')
+            print('Falling back to spacy tokenizer')
+            tokenizer = 'spacy'
+    # first pass: tokenize + count words (map-reduce) - type ids are written to disk, so corpus is never in memory
+    t2type = {t: i for i, t in enumerate(types)}
+    with NumericCorpusWriter(root, types_name, append=num_old_docs > 0) as writer:
+        for chunk_types, chunk_type_ids, doc_lengths, chunk_type_counts in gen_encoded_chunks(
+                gen_texts(p, start, corpus_size), tokenizer=tokenizer):
+            type_ids, type_counts = reduce_chunk(chunk_types, chunk_type_ids, chunk_type_counts,
+                                                 t2type, types, type_counts)
+            writer.add_docs(type_ids, doc_lengths)
+    type_corpus = NumericCorpus.load(root, types_name)
+    save_type_data(root, config.Corpus.name, types, type_counts)
+    # frequency table - shared by all vocab sizes
+    deterministic_w2f = OrderedDict(sorted(zip(types, type_counts.tolist()),
+                                           key=lambda item: (item[1], item[0]), reverse=True))
+    ranked_types = list(deterministic_w2f.keys())
+    t2rank = {t: i for i, t in enumerate(ranked_types)}
+    type2rank = np.array([t2rank[t] for t in types], dtype=np.int64)  # one lookup per type, not per token
+    # second pass: map type ids to ids of each vocab - vectorized
+    for num_vocab in num_vocabs:
+        vocab, rank2id = make_vocab(ranked_types, num_vocab)
+        assert num_vocab is None or len(vocab) == num_vocab
         num_vocab = len(vocab)
-    print('Creating vocab of size {}...'.format(num_vocab))
-    print('Least frequent word occurs {} times'.format(deterministic_w2f[vocab[-2]]))
-    assert '\n' not in vocab
-    assert len(vocab) == num_vocab
-    # insert UNK + make numeric
-    print('Mapping words to ids...')
-    t2id = {t: i for i, t in enumerate(vocab)}
-    numeric_docs = []
-    for doc in docs:
-        numeric_doc = []
-        for n, token in enumerate(doc):
-            if token in t2id:
-                numeric_doc.append(t2id[token])
-            else:
-                doc[n] = config.Corpus.UNK
-                numeric_doc.append(t2id[config.Corpus.UNK])
-        numeric_docs.append(numeric_doc)
-    # save
-    save_corpus_data(deterministic_w2f, vocab, docs, numeric_docs, skip_docs, num_vocab, local)
+        print('Creating vocab of size {}...'.format(num_vocab))
+        print('Least frequent word occurs {} times'.format(
+            min([deterministic_w2f[t] for t in vocab if t in deterministic_w2f])))
+        assert '\n' not in vocab
+        type2id = rank2id[type2rank]
+        is_unk = type2id == -1
+        if is_unk.any():
+            type2id[is_unk] = vocab.index(config.Corpus.UNK)
+        # append new docs if vocab is unchanged - otherwise all docs are re-mapped (but not re-tokenized)
+        name = '{}_{}'.format(config.Corpus.name, num_vocab)
+        is_append = num_old_docs > 0 \
+            and NumericCorpus.exists(root, name) \
+            and load_vocab(root, config.Corpus.name, num_vocab) == vocab
+        print('Vocab unchanged. Appending new docs' if is_append else 'Mapping all docs to vocab')
+        with NumericCorpusWriter(root, name, append=is_append) as writer:
+            start_doc = num_old_docs if is_append else 0
+            for type_ids, doc_lengths in type_corpus.gen_doc_chunks(config.Preprocessing.chunk_size, start_doc):
+                writer.add_docs(type2id[type_ids], doc_lengths)
+        # save
+        save_corpus_data(deterministic_w2f, vocab, skip_docs, num_vocab, local)
+    # manifest is saved last - an interrupted run is detected by the number of docs in the type corpus
+    manifest['ranges'].append([start, corpus_size])
+    manifest['num_docs'] = len(type_corpus)
+    manifest['tokenizer'] = tokenizer
+    manifest['sha1'] = hash_corpus(p, start, corpus_size, corpus_hash).hexdigest()
+    manifest['ends_with_newline'] = ends_with_newline(p, corpus_size)
+    save_manifest(root, config.Corpus.name, manifest)
 
 
 def main(param2val):
@@ -115,8 +160,7 @@ def main(param2val):
             if ev.suffix != '':
                 print('WARNING: Using task file suffix "{}".'.format(ev.suffix))
             # make eval data - row_words can contain duplicates
-            vocab_sims_mat = w2e_to_sims(embedder.w2e, embedder.vocab, embedder.vocab)
-            all_eval_probes, all_eval_candidates_mat = ev.make_all_eval_data(vocab_sims_mat, embedder.vocab)
+            all_eval_probes, all_eval_candidates_mat = ev.make_all_eval_data(embedder.vocab_sims, embedder.vocab)
             ev.row_words, ev.col_words, ev.eval_candidates_mat = ev.downsample(
                 all_eval_probes, all_eval_candidates_mat)
             if config.Eval.verbose:
@@ -0,0 +1,220 @@
+import hashlib
+import numpy as np
+
+from two_process_nlp import config
+from two_process_nlp.atomic import atomic_path
+from two_process_nlp.sims import reduce_sims, TopK
+
+
+class NeighbourIndex(object):
+    """
+    k nearest and k farthest neighbours (by cosine similarity) of every word in vocab.
+    built in blocks of rows, so memory is bounded by vocab size * k - and saved in run directory,
+    so that it is built only once for each run
+    """
+    def __init__(self, vocab, nearest_ids, nearest_sims, farthest_ids, farthest_sims):
+        self.vocab = list(vocab)
+        self.w2id = {w: n for n, w in enumerate(self.vocab)}
+        self.nearest_ids = nearest_ids
+        self.nearest_sims = nearest_sims
+        self.farthest_ids = farthest_ids
+        self.farthest_sims = farthest_sims
+
+    @property
+    def k(self):
+        return self.nearest_ids.shape[1]
+
+    @classmethod
+    def build(cls, w2e, k=None, block_size=None):
+        k = k or config.Embeddings.num_neighbours
+        print('Building neighbour index with k={}...'.format(k))
+        (nearest_ids, nearest_sims), (farthest_ids, farthest_sims) = reduce_sims(
+            w2e, [TopK(k, largest=True, exclude_self=True), TopK(k, largest=False, exclude_self=True)],
+            block_size=block_size)
+        return cls(w2e.vocab, nearest_ids, nearest_sims, farthest_ids, farthest_sims)
+
+    # ///////////////////////////////////////////////////////////// queries
+
+    def query(self, ids, sims, word, k):
+        k = k or self.k
+        if k > self.k:
+            raise AttributeError('Invalid arg to "k". Index has only {} neighbours per word.'.format(self.k))
+        row_id = self.w2id[word]
+        return [(self.vocab[i], float(s)) for i, s in zip(ids[row_id, :k], sims[row_id, :k])]
+
+    def neighbours(self, word, k=None):
+        """
+        list of (word, similarity) - most similar first
+        """
+        return self.query(self.nearest_ids, self.nearest_sims, word, k)
+
+    def farthest(self, word, k=None):
+        """
+        list of (word, similarity) - least similar first
+        """
+        return self.query(self.farthest_ids, self.farthest_sims, word, k)
+
+    # ///////////////////////////////////////////////////////////// io
+
+    @staticmethod
+    def make_path(location):
+        return location / 'neighbours.npz'
+
+    def save(self, location, embeddings_hash):
+        save_npz(self.make_path(location),
+                 vocab=np.array(self.vocab),
+                 nearest_ids=self.nearest_ids,
+                 nearest_sims=self.nearest_sims,
+                 farthest_ids=self.farthest_ids,
+                 farthest_sims=self.farthest_sims,
+                 embeddings_hash=np.array(embeddings_hash))
+
+    @classmethod
+    def load_or_build(cls, location, w2e, k=None, block_size=None):
+        """
+        saved index is re-used if it was built from the same embeddings, with at least k neighbours
+        """
+        k = k or config.Embeddings.num_neighbours
+        p = cls.make_path(location)
+        embeddings_hash = calc_embeddings_hash(w2e)
+        if p.exists():
+            with np.load(str(p)) as loaded:
+                if str(loaded['embeddings_hash']) == embeddings_hash and loaded['nearest_ids'].shape[1] >= k:
+                    print('Loading neighbour index from {}'.format(p))
+                    return cls(loaded['vocab'].tolist(), loaded['nearest_ids'], loaded['nearest_sims'],
+                               loaded['farthest_ids'], loaded['farthest_sims'])
+        res = cls.build(w2e, k, block_size)
+        res.save(location, embeddings_hash)
+        return res
+
+
+class ApproxNeighbourIndex(object):
+    """
+    approximate neighbours by cosine similarity - an inverted file index.
+    words are partitioned by spherical k-means, and a query is compared only to words in the num_probes partitions
+    whose centroids are most similar to it. more probes give higher recall, but are slower
+    """
+    def __init__(self, w2e, centroids, partition_ids, partition_offsets):
+        self.w2e = w2e
+        self.centroids = centroids  # unit length
+        self.partition_ids = partition_ids  # row ids of w2e, sorted by partition
+        self.partition_offsets = partition_offsets
+
+    @property
+    def num_partitions(self):
+        return len(self.centroids)
+
+    @staticmethod
+    def assign(x, centroids, block_size=None):
+        """
+        id of most similar centroid for each row of x - in blocks, so that sims of all rows are never in memory
+        """
+        block_size = block_size or config.Embeddings.sims_block_size
+        res = np.zeros(len(x), dtype=np.int32)
+        for start in range(0, len(x), block_size):
+            res[start:start + block_size] = x[start:start + block_size].dot(centroids.T).argmax(axis=1)
+        return res
+
+    @classmethod
+    def build(cls, w2e, num_partitions=None, num_iterations=None, seed=None):
+        x = w2e.normalized
+        num_partitions = num_partitions or config.Embeddings.num_partitions or int(np.sqrt(len(x)))
+        num_partitions = min(num_partitions, len(x))
+        num_iterations = num_iterations or config.Embeddings.num_kmeans_iterations
+        if seed is None:  # 0 is a valid seed
+            seed = config.Embeddings.kmeans_seed
+        print('Building approximate neighbour index with {} partitions...'.format(num_partitions))
+        # spherical k-means
+        random_state = np.random.RandomState(seed)
+        centroids = x[random_state.choice(len(x), num_partitions, replace=False)]
+        for _ in range(num_iterations):
+            assignments = cls.assign(x, centroids)
+            row_ids = np.argsort(assignments, kind='mergesort')
+            partition_sizes = np.bincount(assignments, minlength=num_partitions)
+            is_filled = partition_sizes > 0
+            starts = np.concatenate([[0], np.cumsum(partition_sizes)[:-1]])[is_filled]
+            sums = np.add.reduceat(x[row_ids], starts, axis=0)
+            centroids[is_filled] = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        # inverted file - row ids of each partition are contiguous
+        assignments = cls.assign(x, centroids)
+        partition_ids = np.argsort(assignments, kind='mergesort').astype(np.int32)
+        partition_offsets = np.zeros(num_partitions + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=num_partitions), out=partition_offsets[1:])
+        return cls(w2e, centroids, partition_ids, partition_offsets)
+
+    # ///////////////////////////////////////////////////////////// queries
+
+    def query(self, vector, k, num_probes=None, largest=True, exclude_id=None):
+        """
+        row ids and similarities of approximately k most (or least) similar words to vector - sorted from most extreme.
+        vector need not be in w2e, e.g. it can be the embedding of a word by another embedder of the same size
+        """
+        num_probes = min(num_probes or config.Embeddings.num_probes, self.num_partitions)
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1)
+        centroid_keys = -self.centroids.dot(vector) if largest else self.centroids.dot(vector)
+        probes = np.argpartition(centroid_keys, num_probes - 1)[:num_probes]
+        candidate_ids = np.concatenate([self.partition_ids[self.partition_offsets[p]:self.partition_offsets[p + 1]]
+                                        for p in probes])
+        if exclude_id is not None:
+            candidate_ids = candidate_ids[candidate_ids != exclude_id]
+        sims = self.w2e.normalized[candidate_ids].dot(vector)
+        order = np.argsort(-sims if largest else sims, kind='mergesort')[:k]
+        return candidate_ids[order], sims[order]
+
+    def neighbours(self, word, k=None, num_probes=None):
+        """
+        list of (word, similarity) - most similar first
+        """
+        k = k or config.Embeddings.num_neighbours
+        row_id = self.w2e.w2id[word]
+        ids, sims = self.query(self.w2e.normalized[row_id], k, num_probes, largest=True, exclude_id=row_id)
+        return [(self.w2e.vocab[i], float(s)) for i, s in zip(ids, sims)]
+
+    def farthest(self, word, k=None, num_probes=None):
+        """
+        list of (word, similarity) - least similar first
+        """
+        k = k or config.Embeddings.num_neighbours
+        row_id = self.w2e.w2id[word]
+        ids, sims = self.query(self.w2e.normalized[row_id], k, num_probes, largest=False, exclude_id=row_id)
+        return [(self.w2e.vocab[i], float(s)) for i, s in zip(ids, sims)]
+
+    # ///////////////////////////////////////////////////////////// io
+
+    @staticmethod
+    def make_path(location):
+        return location / 'approx_neighbours.npz'
+
+    def save(self, location, embeddings_hash):
+        save_npz(self.make_path(location),
+                 centroids=self.centroids,
+                 partition_ids=self.partition_ids,
+                 partition_offsets=self.partition_offsets,
+                 embeddings_hash=np.array(embeddings_hash))
+
+    @classmethod
+    def load_or_build(cls, location, w2e, num_partitions=None):
+        """
+        saved index is re-used if it was built from the same embeddings (and with num_partitions, if specified)
+        """
+        p = cls.make_path(location)
+        embeddings_hash = calc_embeddings_hash(w2e)
+        if p.exists():
+            with np.load(str(p)) as loaded:
+                if str(loaded['embeddings_hash']) == embeddings_hash \
+                        and num_partitions in [None, len(loaded['centroids'])]:
+                    print('Loading approximate neighbour index from {}'.format(p))
+                    return cls(w2e, loaded['centroids'], loaded['partition_ids'], loaded['partition_offsets'])
+        res = cls.build(w2e, num_partitions)
+        res.save(location, embeddings_hash)
+        return res
+
+
+def calc_embeddings_hash(w2e):
+    return hashlib.sha1(np.ascontiguousarray(w2e.embed_mat).tobytes()).hexdigest()
+
+
+def save_npz(p, **arrays):
+    with atomic_path(p) as tmp_p:
+        np.savez(str(tmp_p), **arrays)
@@ -1,5 +1,6 @@
 import numpy as np
 from itertools import cycle, chain
+from ludwigcluster.utils import list_all_param2vals
 
 from two_process_nlp import config
 
@@ -76,10 +77,12 @@ class CountParams:
     ]
     # norm_type = [None, 'row_sum', 'row_logentropy', 'tf_idf', 'ppmi']
     norm_type = ['ppmi']
-    reduce_type = [
+    reduce_type = [  # optional third item is power p of singular values in U * S^p (default is 0)
         # ['svd', 30],
         ['svd', 200],
         # ['svd', 500],
+        # ['svd', 200, 0.5],
+        # ['rsvd', 200],  # randomized svd - see config.Count for accuracy settings
         # [None, None]  # TODO this makes expert training last too long
     ]
 
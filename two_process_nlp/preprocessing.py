@@ -0,0 +1,270 @@
+import hashlib
+import multiprocessing as mp
+import numpy as np
+import time
+import yaml
+from functools import partial
+from itertools import islice
+from spacy.lang.en import English
+
+from two_process_nlp import config
+
+nlp = English()
+
+
+def gen_texts(corpus_p, start=0, stop=None):
+    """
+    yield lines of corpus one at a time, from byte start to byte stop - same lines as f.read().splitlines().
+    bytes appended to the corpus after stop are not read
+    """
+    with corpus_p.open('rb') as f:
+        f.seek(start)
+        pos = start
+        for line in f:
+            if stop is not None:
+                if pos >= stop:
+                    return
+                line = line[:stop - pos]
+            pos += len(line)
+            for text in line.decode('utf-8').splitlines():
+                yield text
+
+
+# ///////////////////////////////////////////////////////////// incremental preprocessing
+
+def make_type_data_paths(root, name):
+    types_p = root / '{}_types.txt'.format(name)
+    type_counts_p = root / '{}_type_counts.npy'.format(name)
+    return types_p, type_counts_p
+
+
+def save_type_data(root, name, types, type_counts):
+    """
+    types in order of first occurrence in corpus - type ids in the type corpus index into these
+    """
+    types_p, type_counts_p = make_type_data_paths(root, name)
+    with types_p.open('w', encoding='utf-8') as f:
+        for t in types:
+            f.write('{}\n'.format(t))
+    np.save(str(type_counts_p), type_counts)
+
+
+def load_type_data(root, name):
+    types_p, type_counts_p = make_type_data_paths(root, name)
+    with types_p.open('r', encoding='utf-8', newline='\n') as f:
+        types = [line[:-1] for line in f]
+    type_counts = np.load(str(type_counts_p))
+    return types, type_counts
+
+
+def hash_corpus(corpus_p, start, stop, h=None):
+    """
+    sha1 of bytes start to stop of corpus - pass h to continue hashing where a previous call stopped
+    """
+    h = h or hashlib.sha1()
+    with corpus_p.open('rb') as f:
+        f.seek(start)
+        num_remaining = stop - start
+        while num_remaining > 0:
+            block = f.read(min(2 ** 20, num_remaining))
+            if not block:
+                break
+            h.update(block)
+            num_remaining -= len(block)
+    return h
+
+
+def ends_with_newline(corpus_p, stop):
+    """
+    False if the line ending at byte stop is unfinished - bytes appended later would continue it
+    """
+    if stop == 0:
+        return True
+    with corpus_p.open('rb') as f:
+        f.seek(stop - 1)
+        return f.read(1) == b'\n'
+
+
+def load_manifest(root, name):
+    """
+    manifest records the byte ranges of the corpus that have been preprocessed, and with which tokenizer,
+    and the hash of all preprocessed bytes - to detect edits to lines that were already preprocessed
+    """
+    p = root / '{}_manifest.yaml'.format(name)
+    if not p.exists():
+        return None
+    with p.open('r') as f:
+        return yaml.safe_load(f)
+
+
+def save_manifest(root, name, manifest):
+    p = root / '{}_manifest.yaml'.format(name)
+    with p.open('w') as f:
+        yaml.dump(manifest, f, default_flow_style=False)
+
+
+def load_vocab(root, name, num_vocab):
+    p = root / '{}_{}_vocab.txt'.format(name, num_vocab)
+    if not p.exists():
+        return None
+    with p.open('r') as f:
+        return f.read().splitlines()
+
+
+def tokenize_chunk(texts):
+    """
+    run the tokenizer only - English() has no other pipeline components, so tokens are the same as nlp(text)
+    """
+    return [[w.text for w in spacy_doc] for spacy_doc in nlp.tokenizer.pipe(texts)]
+
+
+def tokenize_chunk_by_whitespace(texts):
+    return [text.split() for text in texts]
+
+
+def sample_texts(texts, num_texts, seed):
+    """
+    reservoir sampling - texts are read only once and need not fit in memory
+    """
+    random_state = np.random.RandomState(seed)
+    res = []
+    for n, text in enumerate(texts):
+        if n < num_texts:
+            res.append(text)
+        else:
+            i = random_state.randint(0, n + 1)
+            if i < num_texts:
+                res[i] = text
+    return res
+
+
+def verify_whitespace_tokenizer(texts, num_texts=None, seed=None):
+    """
+    return True if a random sample of texts is tokenized identically by spacy and by splitting on whitespace
+    """
+    num_texts = num_texts or config.Preprocessing.num_verification_docs
+    if seed is None:  # 0 is a valid seed
+        seed = config.Preprocessing.verification_seed
+    print('Verifying whitespace tokenizer on {} random docs...'.format(num_texts))
+    sample = sample_texts(texts, num_texts, seed)
+    for text, spacy_doc, whitespace_doc in zip(sample, tokenize_chunk(sample), tokenize_chunk_by_whitespace(sample)):
+        if spacy_doc != whitespace_doc:
+            mismatch = next((s, w) for s, w in zip(spacy_doc + [None], whitespace_doc + [None]) if s != w)
+            print('Whitespace tokenizer does not match spacy: "{}" vs. "{}" in "{}..."'.format(
+                mismatch[0], mismatch[1], text[:100]))
+            return False
+    return True
+
+
+def encode_chunk(tokenized_chunk, t2type, types):
+    """
+    map tokens to type ids (order of first occurrence) - new types are added to t2type and types.
+    returns type ids of all docs concatenated, and doc lengths
+    """
+    type_ids = []
+    for doc in tokenized_chunk:
+        for token in doc:
+            type_id = t2type.get(token)
+            if type_id is None:
+                type_id = len(types)
+                t2type[token] = type_id
+                types.append(token)
+            type_ids.append(type_id)
+    doc_lengths = np.array([len(doc) for doc in tokenized_chunk], dtype=np.int64)
+    return np.array(type_ids, dtype=np.int32), doc_lengths
+
+
+def make_vocab(ranked_types, num_vocab):
+    """
+    ranked_types are sorted by descending frequency - so vocabs of different sizes are nested.
+    returns sorted vocab, and an array mapping frequency rank to vocab id (-1 if type is not in vocab)
+    """
+    if num_vocab is None:  # if no vocab specified, use the whole corpus
+        vocab = list(sorted(ranked_types))
+        num_in_vocab = len(ranked_types)
+    else:
+        vocab = list(sorted(ranked_types[:num_vocab - 1] + [config.Corpus.UNK]))
+        num_in_vocab = min(num_vocab - 1, len(ranked_types))
+    t2id = {t: i for i, t in enumerate(vocab)}
+    rank2id = np.full(len(ranked_types), -1, dtype=np.int32)
+    rank2id[:num_in_vocab] = [t2id[t] for t in ranked_types[:num_in_vocab]]
+    return vocab, rank2id
+
+
+def gen_chunks(texts, chunk_size):
+    it = iter(texts)
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def map_chunk(texts, tokenizer):
+    """
+    map step - runs in worker process.
+    tokenize + encode texts using type ids local to this chunk, and count types.
+    only integers and the (few) types of the chunk are sent back to the main process, not tokens
+    """
+    if tokenizer == 'spacy':
+        tokenized_chunk = tokenize_chunk(texts)
+    elif tokenizer == 'whitespace':
+        tokenized_chunk = tokenize_chunk_by_whitespace(texts)
+    else:
+        raise AttributeError('Invalid arg to "tokenizer".')
+    chunk_types = []
+    chunk_type_ids, doc_lengths = encode_chunk(tokenized_chunk, {}, chunk_types)
+    chunk_type_counts = np.bincount(chunk_type_ids, minlength=len(chunk_types))
+    return chunk_types, chunk_type_ids, doc_lengths, chunk_type_counts
+
+
+def reduce_chunk(chunk_types, chunk_type_ids, chunk_type_counts, t2type, types, type_counts):
+    """
+    reduce step - merge chunk into corpus-wide types (one lookup per type, not per token).
+    new types are added to t2type and types, in order of first occurrence.
+    returns corpus-wide type ids of chunk, and updated type_counts
+    """
+    chunk2type = np.zeros(len(chunk_types), dtype=np.int32)
+    for n, t in enumerate(chunk_types):
+        type_id = t2type.get(t)
+        if type_id is None:
+            type_id = len(types)
+            t2type[t] = type_id
+            types.append(t)
+        chunk2type[n] = type_id
+    type_counts = np.pad(type_counts, (0, len(types) - len(type_counts)), 'constant')
+    type_counts[chunk2type] += chunk_type_counts  # chunk2type has no duplicates
+    return chunk2type[chunk_type_ids], type_counts
+
+
+def gen_encoded_chunks(texts, num_processes=None, chunk_size=None, tokenizer=None):
+    """
+    yield output of map_chunk for chunks of texts, in the same order as texts - chunks are mapped in parallel
+    """
+    num_processes = num_processes or config.Preprocessing.num_processes
+    chunk_size = chunk_size or config.Preprocessing.chunk_size
+    tokenizer = tokenizer or config.Corpus.tokenizer
+    if tokenizer not in ['spacy', 'whitespace']:
+        raise AttributeError('Invalid arg to "tokenizer".')
+    print('\nTokenizing docs with {} tokenizer in {} processes with chunk size={}...'.format(
+        tokenizer, num_processes, chunk_size))
+    start = time.time()
+    num_docs = 0
+    if num_processes == 1:
+        for chunk in gen_chunks(texts, chunk_size):
+            res = map_chunk(chunk, tokenizer)
+            num_docs += len(res[2])
+            yield res
+    else:
+        pool = mp.Pool(processes=num_processes)
+        try:
+            map_fun = partial(map_chunk, tokenizer=tokenizer)
+            for res in pool.imap(map_fun, gen_chunks(texts, chunk_size)):  # imap preserves order
+                num_docs += len(res[2])
+                yield res
+        finally:
+            pool.close()
+            pool.join()
+    duration = time.time() - start
+    print('Tokenized {} docs in {:.1f} secs ({:,.0f} docs/sec)'.format(
+        num_docs, duration, num_docs / max(duration, 1e-6)))
@@ -0,0 +1,93 @@
+import numpy as np
+from scipy import sparse
+
+
+class MemmapCSR(object):
+    """
+    read-only csr matrix whose arrays are memory-mapped - slicing rows returns an in-memory csr matrix
+    """
+    def __init__(self, data, indices, indptr, shape):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = shape
+
+    def __getitem__(self, rows):
+        if not isinstance(rows, slice) or rows.step not in [None, 1]:
+            raise AttributeError('MemmapCSR only supports contiguous row slices.')
+        start, stop, _ = rows.indices(self.shape[0])
+        indptr = np.asarray(self.indptr[start:stop + 1])
+        data = np.asarray(self.data[indptr[0]:indptr[-1]])
+        indices = np.asarray(self.indices[indptr[0]:indptr[-1]])
+        return sparse.csr_matrix((data, indices, indptr - indptr[0]), shape=(stop - start, self.shape[1]))
+
+
+def to_memmap(input_matrix, dir_p):
+    """
+    save matrix to dir_p and re-open it memory-mapped, so that only one block of rows is in memory at a time
+    """
+    if sparse.issparse(input_matrix):
+        csr = sparse.csr_matrix(input_matrix)
+        arrays = []
+        for name in ['data', 'indices', 'indptr']:
+            p = dir_p / '{}.npy'.format(name)
+            np.save(str(p), getattr(csr, name))
+            arrays.append(np.load(str(p), mmap_mode='r'))
+        return MemmapCSR(*arrays, shape=csr.shape)
+    else:
+        p = dir_p / 'dense.npy'
+        np.save(str(p), input_matrix)
+        return np.load(str(p), mmap_mode='r')
+
+
+def gen_row_blocks(input_matrix, block_size):
+    num_rows = input_matrix.shape[0]
+    for start in range(0, num_rows, block_size):
+        stop = min(start + block_size, num_rows)
+        yield start, stop, input_matrix[start:stop]
+
+
+def calc_squared_norm(block):
+    if sparse.issparse(block):
+        return np.square(block.data).sum()
+    else:
+        return np.square(block).sum()
+
+
+def randomized_svd(input_matrix, rank, num_oversamples, num_power_iterations, block_size, seed=42):
+    """
+    truncated svd via randomized range-finding (Halko, Martinsson & Tropp, 2011).
+    input_matrix is only accessed one block of rows at a time, so it may be memory-mapped.
+    returns u, s (descending), vt and the relative Frobenius reconstruction error of u * s * vt
+    """
+    num_rows, num_cols = input_matrix.shape
+    num_samples = min(rank + num_oversamples, num_rows, num_cols)
+
+    def multiply(right):  # input_matrix * right
+        res = np.zeros((num_rows, right.shape[1]))
+        for start, stop, block in gen_row_blocks(input_matrix, block_size):
+            res[start:stop] = block.dot(right)
+        return res
+
+    def multiply_transposed(left):  # input_matrix.T * left
+        res = np.zeros((num_cols, left.shape[1]))
+        for start, stop, block in gen_row_blocks(input_matrix, block_size):
+            res += block.T.dot(left[start:stop])
+        return res
+
+    # range-finding
+    random_state = np.random.RandomState(seed)
+    q, _ = np.linalg.qr(multiply(random_state.normal(size=(num_cols, num_samples))))
+    for _ in range(num_power_iterations):  # re-orthonormalize after each product for numerical stability
+        z, _ = np.linalg.qr(multiply_transposed(q))
+        q, _ = np.linalg.qr(multiply(z))
+    # project onto range and decompose small matrix
+    b = multiply_transposed(q).T
+    ub, s, vt = np.linalg.svd(b, full_matrices=False)
+    u = q.dot(ub[:, :rank])
+    s = s[:rank]
+    vt = vt[:rank]
+    # u * s * vt is an orthogonal projection of input_matrix - so its residual is ||A||^2 - sum(s^2)
+    squared_norm = sum([calc_squared_norm(block) for _, _, block in gen_row_blocks(input_matrix, block_size)])
+    error = np.sqrt(max(squared_norm - np.square(s).sum(), 0) / squared_norm) if squared_norm > 0 else 0.0
+    return u, s, vt, error
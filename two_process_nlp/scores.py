@@ -10,15 +10,12 @@ def calc_accuracy(eval_sims_mat, eval_probes, eval_candidates_mat):
     """
     assert eval_probes is not None
     assert eval_sims_mat.shape == eval_candidates_mat.shape
-    num_correct = 0
-    num_total = 0
     # if there are multiple relata and/or lures - break each multi-answer question into 2-answer question
-    for eval_sims_row in eval_sims_mat:
-        for r_id in range(config.Eval.num_relata):
-            for l_id in range(config.Eval.num_lures):
-                if eval_sims_row[r_id] > eval_sims_row[config.Eval.num_relata + l_id]:
-                    num_correct += 1
-                num_total +=1
+    relata_sims = eval_sims_mat[:, :config.Eval.num_relata]
+    lures_sims = eval_sims_mat[:, config.Eval.num_relata:config.Eval.num_relata + config.Eval.num_lures]
+    is_correct = relata_sims[:, :, np.newaxis] > lures_sims[:, np.newaxis, :]  # [rows, relata, lures]
+    num_correct = int(np.count_nonzero(is_correct))
+    num_total = is_correct.size
     res = num_correct / num_total
     return res
 
@@ -0,0 +1,123 @@
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from two_process_nlp import config
+
+
+def gen_sims_blocks(w2e, row_words=None, col_words=None, block_size=None):
+    """
+    yield cosine similarities (float32) of row_words with col_words, block_size rows at a time.
+    embeddings are normalized only once (cached by w2e), so each block is a single matrix product.
+    row_words and col_words default to all words in w2e
+    """
+    block_size = block_size or config.Embeddings.sims_block_size
+    normalized = w2e.normalized
+    x = normalized if row_words is None else normalized[w2e.ids(row_words)]
+    y = normalized if col_words is None else normalized[w2e.ids(col_words)]
+    for start in range(0, len(x), block_size):
+        stop = min(start + block_size, len(x))
+        yield start, stop, x[start:stop].dot(y.T)
+
+
+def reduce_sims(w2e, reducer, row_words=None, col_words=None, block_size=None):
+    """
+    stream blocks of similarities to reducer (or a list of reducers) - the full similarity matrix is never in memory
+    """
+    reducers = reducer if isinstance(reducer, (list, tuple)) else [reducer]
+    num_rows = len(w2e) if row_words is None else len(row_words)
+    num_cols = len(w2e) if col_words is None else len(col_words)
+    for r in reducers:
+        r.start(num_rows, num_cols)
+    for start, stop, block in gen_sims_blocks(w2e, row_words, col_words, block_size):
+        for r in reducers:
+            r.update(start, stop, block)
+    res = [r.result() for r in reducers]
+    return res if isinstance(reducer, (list, tuple)) else res[0]
+
+
+# ///////////////////////////////////////////////////////////// reducers - must not modify blocks
+
+
+class MeanStd(object):
+    """
+    mean and standard deviation of all similarities - accumulated in float64
+    """
+    def start(self, num_rows, num_cols):
+        self.num_sims = 0
+        self.total = 0.0
+        self.total_squared = 0.0
+
+    def update(self, start, stop, block):
+        self.num_sims += block.size
+        self.total += block.sum(dtype=np.float64)
+        self.total_squared += np.square(block).sum(dtype=np.float64)
+
+    def result(self):
+        mean = self.total / self.num_sims
+        std = np.sqrt(max(self.total_squared / self.num_sims - mean ** 2, 0.0))
+        return mean, std
+
+
+class ArgMin(object):
+    """
+    column id and value of smallest similarity in each row
+    """
+    def start(self, num_rows, num_cols):
+        self.col_ids = np.zeros(num_rows, dtype=np.int64)
+        self.sims = np.zeros(num_rows, dtype=np.float32)
+
+    def update(self, start, stop, block):
+        col_ids = block.argmin(axis=1)
+        self.col_ids[start:stop] = col_ids
+        self.sims[start:stop] = block[np.arange(len(block)), col_ids]
+
+    def result(self):
+        return self.col_ids, self.sims
+
+
+class TopK(object):
+    """
+    column ids and values of k largest (or smallest) similarities in each row, sorted from most extreme.
+    if exclude_self, rows and columns must be the same words - and each word is excluded from its own row
+    """
+    def __init__(self, k, largest=True, exclude_self=False):
+        self.k = k
+        self.largest = largest
+        self.exclude_self = exclude_self
+
+    def start(self, num_rows, num_cols):
+        self.k = min(self.k, num_cols - 1 if self.exclude_self else num_cols)
+        self.col_ids = np.zeros((num_rows, self.k), dtype=np.int64)
+        self.sims = np.zeros((num_rows, self.k), dtype=np.float32)
+
+    def update(self, start, stop, block):
+        keys = -block if self.largest else block.copy()  # smallest keys are selected
+        row_ids = np.arange(stop - start)
+        if self.exclude_self:
+            keys[row_ids, np.arange(start, stop)] = np.inf
+        col_ids = np.argpartition(keys, self.k - 1, axis=1)[:, :self.k]
+        order = np.argsort(keys[row_ids[:, np.newaxis], col_ids], axis=1)
+        col_ids = col_ids[row_ids[:, np.newaxis], order]
+        self.col_ids[start:stop] = col_ids
+        self.sims[start:stop] = block[row_ids[:, np.newaxis], col_ids]
+
+    def result(self):
+        return self.col_ids, self.sims
+
+
+class MemmapSink(object):
+    """
+    write all similarities to a memory-mapped .npy file at p - for matrices which do not fit in memory
+    """
+    def __init__(self, p):
+        self.p = p
+
+    def start(self, num_rows, num_cols):
+        self.mat = open_memmap(str(self.p), mode='w+', dtype=np.float32, shape=(num_rows, num_cols))
+
+    def update(self, start, stop, block):
+        self.mat[start:stop] = block
+
+    def result(self):
+        self.mat.flush()
+        return self.mat
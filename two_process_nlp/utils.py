@@ -1,14 +1,13 @@
-import pickle
 import shutil
 
 import numpy as np
 import yaml
-from sklearn.metrics.pairwise import cosine_similarity
 
 from two_process_nlp.embedders.rnn import RNNEmbedder
 from two_process_nlp.embedders.count import CountEmbedder
 from two_process_nlp.embedders.random_control import RandomControlEmbedder
 from two_process_nlp.embedders.w2vec import W2VecEmbedder
+from two_process_nlp.corpus import Docs
 from two_process_nlp import config
 
 
@@ -29,7 +28,10 @@ def save_param2val(param2val, local=False):
             yaml.dump(param2val, f, default_flow_style=False, allow_unicode=True)
 
 
-def save_corpus_data(deterministic_w2f, vocab, docs, numeric_docs, skip_docs, num_vocab, local):
+def save_corpus_data(deterministic_w2f, vocab, skip_docs, num_vocab, local):
+    """
+    numeric docs are written during preprocessing - docs are a copy of them, together with vocab
+    """
     #
     root = config.LocalDirs.root if local else config.RemoteDirs.root
     print('Sending results from corpus preprocessing to {}'.format(root))
@@ -43,23 +45,10 @@ def save_corpus_data(deterministic_w2f, vocab, docs, numeric_docs, skip_docs, nu
     with p.open('w') as f:
         for v in vocab:
             f.write('{}\n'.format(v))
-    # save numeric_docs
-    p = root / '{}_{}_numeric_docs.pkl'.format(config.Corpus.name, num_vocab)
-    with p.open('wb') as f:
-        pickle.dump(numeric_docs, f)
-    # save docs
+    # save docs - a single artifact shared by all workers
     if skip_docs or local:
         return  # takes long to upload docs to file server
-    # save docs for each worker - otherwise multiple workers will open same files causing EOFError
-    from ludwigcluster.config import SFTP
-    for worker in SFTP.worker_names:
-        p = root / '{}_{}_{}_docs.pkl'.format(worker, config.Corpus.name, num_vocab)
-        with p.open('wb') as f:
-            pickle.dump(docs, f)
-
-    p = root / '{}_{}_docs.pkl'.format(config.Corpus.name, num_vocab)
-    with p.open('wb') as f:
-        pickle.dump(docs, f)
+    Docs.save(root, '{}_{}'.format(config.Corpus.name, num_vocab), vocab)
 
 
 def init_embedder(param2val):
@@ -82,10 +71,10 @@ def init_embedder(param2val):
 
 
 def w2e_to_sims(w2e, row_words, col_words):
-    x = np.vstack([w2e[w] for w in row_words])
-    y = np.vstack([w2e[w] for w in col_words])
-    # sim
-    res = cosine_similarity(x, y)
+    x = w2e.normalized[w2e.ids(row_words)]
+    y = w2e.normalized[w2e.ids(col_words)]
+    # sim - float32
+    res = x.dot(y.T)
     if config.Eval.verbose:
         print('Shape of similarity matrix: {}'.format(res.shape))
-    return np.around(res, config.Embeddings.precision)
\ No newline at end of file
+    return np.around(res, config.Embeddings.precision, out=res)
\ No newline at end of file
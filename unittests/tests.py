@@ -1,38 +1,311 @@
+import tempfile
 import unittest
+from unittest import mock
 import numpy as np
+import yaml
+from pathlib import Path
+from scipy import sparse
 
 from two_process_nlp import config
 from two_process_nlp.job import preprocessing_job
 from two_process_nlp.params import CountParams
-from two_process_nlp.embedders.count import CountEmbedder
+from two_process_nlp.embedders.count import CountEmbedder, make_ternary_vectors
+from two_process_nlp.corpus import NumericCorpus, NumericCorpusWriter, spool_to_npy
+from two_process_nlp.scores import calc_accuracy
+from two_process_nlp.rsvd import randomized_svd, to_memmap
+from two_process_nlp.embeddings import EmbeddingTable, save_embeddings, load_embeddings, convert_txt_embeddings
+from two_process_nlp.sims import reduce_sims, MeanStd, ArgMin, TopK, MemmapSink
+from two_process_nlp.neighbours import NeighbourIndex
+from two_process_nlp.utils import w2e_to_sims
+from two_process_nlp.evaluators.identification import Identification
 
 from ludwigcluster.utils import list_all_param2vals
 
 
+# backward counts for "the horse raced past the barn fell" with 5-word linear window
+CORRECT_BACKWARD = np.array([[0, 0, 2, 4, 3, 6],
+                             [5, 0, 1, 3, 2, 4],
+                             [0, 0, 0, 0, 0, 5],
+                             [0, 0, 4, 0, 5, 3],
+                             [0, 0, 5, 0, 0, 4],
+                             [0, 0, 3, 5, 4, 2]])
+
+
+def make_ww_test_embedder(window_type):
+    config.Corpus.name = 'ww_test'
+    config.Corpus.num_vocab = None
+    preprocessing_job()
+    # embedder
+    embedder = list(CountEmbedder(param2val)
+                    for param2val in list_all_param2vals(CountParams))[0]
+    embedder.name = 'ww'
+    embedder.count_type = ['ww', window_type, 5, 'linear']
+    embedder.norm_type = None
+    embedder.reduce_type = [None, None]
+    return embedder
+
+
 class MyTest(unittest.TestCase):
     def test_update_matrix(self):
-        #
-        config.Corpus.name = 'ww_test'
-        config.Corpus.num_vocab = None
-        preprocessing_job()
-        # embedder
-        embedder = list(CountEmbedder(param2val)
-                        for param2val in list_all_param2vals(CountParams))[0]
-        embedder.name = 'ww'
-        embedder.count_type = ['ww', 'backward', 5, 'linear']
-        embedder.norm_type = None
-        embedder.reduce_type = [None, None]
+        embedder = make_ww_test_embedder('backward')
         #
         reduced_mat = embedder.train()
-        correct = np.array([[0, 0, 2, 4, 3, 6],
-                            [5, 0, 1, 3, 2, 4],
-                            [0, 0, 0, 0, 0, 5],
-                            [0, 0, 4, 0, 5, 3],
-                            [0, 0, 5, 0, 0, 4],
-                            [0, 0, 3, 5, 4, 2]])
-        for i, j in zip(reduced_mat.flatten(), correct.flatten()):
+        for i, j in zip(reduced_mat.flatten(), CORRECT_BACKWARD.flatten()):
             self.assertEqual(i, j)
 
+    def test_window_types(self):
+        window_type2correct = {'forward': CORRECT_BACKWARD.T,
+                               'backward': CORRECT_BACKWARD,
+                               'summed': CORRECT_BACKWARD + CORRECT_BACKWARD.T,
+                               'concatenated': np.hstack((CORRECT_BACKWARD.T, CORRECT_BACKWARD))}
+        for window_type, correct in window_type2correct.items():
+            embedder = make_ww_test_embedder(window_type)
+            count_mat = embedder.create_ww_matrix_fast()
+            np.testing.assert_array_equal(count_mat.toarray(), correct)
+
+    def test_sparse_and_dense_normalizations(self):
+        embedder = make_ww_test_embedder('concatenated')
+        count_mat = embedder.create_ww_matrix_fast()
+        for norm_type in ['row_sum', 'col_sum', 'tf_idf', 'row_logentropy', 'ppmi']:
+            sparse_norm_mat, _ = embedder.normalize(count_mat, norm_type)
+            dense_norm_mat, _ = embedder.normalize(count_mat.toarray(), norm_type)
+            np.testing.assert_allclose(sparse_norm_mat.toarray(), dense_norm_mat)
+
+    def test_count_matrix_cache(self):
+        embedder = make_ww_test_embedder('forward')
+        count_mat1 = embedder.create_ww_matrix_fast()
+        self.assertTrue(embedder.make_cache_path('count_matrices', 'ww_5_linear').exists())
+        embedder.count_type = ['ww', 'backward', 5, 'linear']  # same raw counts - loaded from cache
+        count_mat2 = embedder.create_ww_matrix_fast()
+        np.testing.assert_array_equal(count_mat1.toarray(), count_mat2.toarray().T)
+
+    def test_svd_sizes_share_decomposition(self):
+        embedder = make_ww_test_embedder('concatenated')
+        embedder.norm_type = 'ppmi'
+        embedder.reduce_type = ['svd', 4]
+        embedder.train()  # caches decomposition of largest size
+        norm_mat, _ = embedder.normalize(embedder.create_ww_matrix_fast(), 'ppmi')
+        u, s, vt = np.linalg.svd(norm_mat.toarray(), full_matrices=False)  # singular values in descending order
+        for weight_power in [0, 1]:
+            embedder.reduce_type = ['svd', 2, weight_power]  # sliced from cached svd
+            reduced_mat = embedder.train()
+            # singular vectors are unique up to sign
+            np.testing.assert_allclose(np.abs(reduced_mat), np.abs(u[:, :2] * s[:2] ** weight_power), atol=1e-6)
+
+    def test_wd_matrix(self):
+        embedder = make_ww_test_embedder('forward')
+        embedder.numeric_docs = NumericCorpus.from_docs([[0, 1, 1], [], [2, 5, 2, 2], [], [0]])
+        correct = np.array([[1, 0, 0, 0, 1],
+                            [2, 0, 0, 0, 0],
+                            [0, 0, 3, 0, 0],
+                            [0, 0, 0, 0, 0],
+                            [0, 0, 0, 0, 0],
+                            [0, 0, 1, 0, 0]])
+        count_mat = embedder.create_wd_matrix()
+        self.assertTrue(sparse.isspmatrix_csr(count_mat))
+        np.testing.assert_array_equal(count_mat.toarray(), correct)
+
+    def test_randomized_svd(self):
+        random_state = np.random.RandomState(42)
+        dense_mat = random_state.rand(50, 30) * (random_state.rand(50, 30) < 0.3)
+        _, s, _ = np.linalg.svd(dense_mat, full_matrices=False)
+        u1, s1, vt1, error = randomized_svd(dense_mat, 5, 10, 4, block_size=16)
+        np.testing.assert_allclose(s1, s[:5], rtol=1e-3)
+        self.assertAlmostEqual(error, np.linalg.norm(dense_mat - (u1 * s1).dot(vt1)) / np.linalg.norm(dense_mat))
+        # memory-mapped dense and sparse matrices - only one block of rows is read at a time
+        for input_matrix in [dense_mat, sparse.csr_matrix(dense_mat)]:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                u2, s2, vt2, _ = randomized_svd(to_memmap(input_matrix, Path(tmp_dir)), 5, 10, 4, block_size=16)
+            np.testing.assert_allclose(u2, u1, atol=1e-10)
+            np.testing.assert_allclose(s2, s1)
+        # train streams normalized matrix from disk
+        embedder = make_ww_test_embedder('concatenated')
+        embedder.norm_type = 'ppmi'
+        embedder.reduce_type = ['rsvd', 2, 1]
+        reduced_mats = []
+        for rsvd_memmap in [False, True]:
+            with mock.patch.object(config.Count, 'rsvd_memmap', rsvd_memmap), \
+                    mock.patch.object(config.Count, 'cache_svds', False):
+                reduced_mats.append(embedder.train())
+        np.testing.assert_allclose(reduced_mats[0], reduced_mats[1], atol=1e-10)
+
+    def test_rva(self):
+        embedder = CountEmbedder({'param_name': 'test',
+                                  'job_name': 'test',
+                                  'count_type': ['ww', 'forward', 5, 'linear'],
+                                  'norm_type': None,
+                                  'reduce_type': ['rva', 16]})
+        ternary_vectors = make_ternary_vectors(20, 16, 8, np.random.RandomState(0)).toarray()
+        np.testing.assert_array_equal(np.count_nonzero(ternary_vectors, axis=1), 8)
+        np.testing.assert_array_equal(np.abs(ternary_vectors[ternary_vectors != 0]), 1)
+        # one random vector per column - rows are multiplied in blocks smaller than the matrix
+        random_state = np.random.RandomState(42)
+        dense_mat = random_state.rand(10, 20) * (random_state.rand(10, 20) < 0.3)
+        for rva_vector_type in ['normal', 'ternary']:
+            random_state = np.random.RandomState(config.Count.rva_seed)
+            if rva_vector_type == 'normal':
+                random_vectors = random_state.normal(0, 1, [20, 16])
+            else:
+                random_vectors = make_ternary_vectors(20, 16, config.Count.rva_num_nonzero, random_state).toarray()
+            for input_matrix in [dense_mat, sparse.csr_matrix(dense_mat)]:
+                with mock.patch.object(config.Count, 'rva_vector_type', rva_vector_type), \
+                        mock.patch.object(config.Count, 'rva_block_size', 3):
+                    rva_mat, _ = embedder.reduce_rva(input_matrix, 16)
+                np.testing.assert_allclose(rva_mat, dense_mat.dot(random_vectors))  # same vectors for same rva_seed
+
+    def test_sharded_count(self):
+        embedder = make_ww_test_embedder('forward')
+        np.random.seed(42)
+        embedder.numeric_docs = NumericCorpus.from_docs(
+            [np.random.randint(0, 6, np.random.randint(1, 20)).tolist() for _ in range(30)])
+        count_mats = []
+        for num_workers in [1, 3]:
+            with mock.patch.object(config.Count, 'num_count_workers', num_workers):
+                count_mats.append(embedder.count_ww_matrix(5, 'linear').toarray())
+        np.testing.assert_array_equal(count_mats[0], count_mats[1])
+
+    def test_incremental_preprocessing(self):
+        steps = [('w', 'the horse raced past the barn fell\nthe horse ran\n', 1),
+                 ('a', 'the horse fell down\n', 2),  # vocab of size 3 is unchanged - docs are appended
+                 ('a', 'the dog', 3),  # no trailing newline
+                 ('a', 'gie barked\n', 1),  # continues unfinished line - whole corpus is preprocessed again
+                 ('w', 'the horse raced past the old barn fell\nthe horse ran\n', 1)]  # earlier line was edited
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch.object(config.LocalDirs, 'corpora', Path(tmp_dir)), \
+                mock.patch.object(config.Corpus, 'name', 'incremental_test'), \
+                mock.patch.object(config.Corpus, 'tokenizer', 'whitespace'), \
+                mock.patch.object(config.Preprocessing, 'num_processes', 1):
+            corpus_p = Path(tmp_dir) / 'incremental_test.txt'
+            incremental_root = Path(tmp_dir) / 'incremental'
+            incremental_root.mkdir()
+            for n, (mode, text, num_ranges) in enumerate(steps):
+                with corpus_p.open(mode) as f:
+                    f.write(text)
+                full_root = Path(tmp_dir) / 'full_{}'.format(n)
+                full_root.mkdir()
+                for root, incremental in [(incremental_root, True), (full_root, False)]:
+                    with mock.patch.object(config.LocalDirs, 'root', root):
+                        preprocessing_job([3, None], local=True, incremental=incremental)
+                with (incremental_root / 'incremental_test_manifest.yaml').open('r') as f:
+                    self.assertEqual(len(yaml.safe_load(f)['ranges']), num_ranges)
+                for full_p in full_root.iterdir():
+                    incremental_p = incremental_root / full_p.name
+                    if full_p.suffix == '.npy':
+                        np.testing.assert_array_equal(np.load(str(full_p)), np.load(str(incremental_p)))
+                    elif not full_p.name.endswith('_manifest.yaml'):  # byte ranges differ
+                        self.assertEqual(full_p.read_text(), incremental_p.read_text())
+
+    def test_append_after_partial_write(self):
+        docs = [[0, 1, 2], [3], [4, 5]]
+        new_docs = [[6, 7], [], [8]]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            NumericCorpus.from_docs(docs).save(Path(tmp_dir), 'partial')
+            token_ids_p, _ = NumericCorpus.make_paths(Path(tmp_dir), 'partial')
+            # a run died after saving token ids, but before saving doc offsets
+            spool_f = tempfile.TemporaryFile()
+            spool_f.write(np.array([9, 9, 9], dtype=np.int32).tobytes())
+            spool_to_npy(spool_f, token_ids_p, np.int32, append=True)
+            # another run died after writing token ids, but before re-writing the header
+            with token_ids_p.open('ab') as f:
+                f.write(np.array([9, 9], dtype=np.int32).tobytes())
+            with NumericCorpusWriter(Path(tmp_dir), 'partial', append=True) as writer:
+                for doc in new_docs:
+                    writer.add_doc(doc)
+            corpus = NumericCorpus.load(Path(tmp_dir), 'partial')
+            self.assertEqual([doc.tolist() for doc in corpus], docs + new_docs)
+            self.assertEqual(corpus.num_tokens, 9)
+
+    def test_save_and_load_embeddings(self):
+        vocab = ['b', 'a', 'c']  # order of rows is kept
+        embed_mat = np.random.RandomState(42).randn(3, 4)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            save_embeddings(Path(tmp_dir), embed_mat, vocab)
+            loaded_embed_mat, loaded_vocab = load_embeddings(Path(tmp_dir))
+            self.assertIsInstance(loaded_embed_mat, np.memmap)
+            self.assertEqual(loaded_embed_mat.dtype, np.float32)
+            np.testing.assert_allclose(loaded_embed_mat, embed_mat, rtol=1e-6)
+            self.assertEqual(loaded_vocab, vocab)
+            del loaded_embed_mat
+            # vocab does not match matrix
+            (Path(tmp_dir) / 'embeddings_vocab.txt').write_text('b\na\n', encoding='utf-8')
+            self.assertRaises(RuntimeError, load_embeddings, Path(tmp_dir))
+
+    def test_convert_txt_embeddings(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            (Path(tmp_dir) / 'embeddings.txt').write_text('b 0.5 -1.0\na 2.0 0.25\n')
+            convert_txt_embeddings(Path(tmp_dir))
+            embed_mat, vocab = load_embeddings(Path(tmp_dir))
+            np.testing.assert_array_equal(embed_mat, [[0.5, -1.0], [2.0, 0.25]])
+            self.assertEqual(vocab, ['b', 'a'])
+            del embed_mat
+
+    def test_sims_reducers(self):
+        vocab = ['w{}'.format(i) for i in range(23)]
+        w2e = EmbeddingTable(np.random.RandomState(42).randn(23, 8), vocab)
+        sims_mat = w2e_to_sims(w2e, vocab, vocab)  # rounded to config.Embeddings.precision
+        atol = 10 ** -config.Embeddings.precision
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            (mean, std), (min_ids, min_sims), (near_ids, near_sims), (far_ids, far_sims), memmap_mat = reduce_sims(
+                w2e, [MeanStd(), ArgMin(), TopK(3, exclude_self=True), TopK(3, largest=False, exclude_self=True),
+                      MemmapSink(Path(tmp_dir) / 'sims.npy')], block_size=5)
+            np.testing.assert_allclose(np.load(str(Path(tmp_dir) / 'sims.npy')), sims_mat, atol=atol)
+            del memmap_mat
+        self.assertAlmostEqual(mean, sims_mat.mean(), places=4)
+        self.assertAlmostEqual(std, sims_mat.std(), places=4)
+        row_ids = np.arange(23)[:, np.newaxis]
+        np.testing.assert_allclose(min_sims, sims_mat.min(axis=1), atol=atol)
+        np.testing.assert_allclose(sims_mat[row_ids[:, 0], min_ids], min_sims, atol=atol)
+        # each word is excluded from its own neighbours
+        sims_without_self = sims_mat[~np.eye(23, dtype=bool)].reshape(23, 22)
+        np.testing.assert_allclose(near_sims, -np.sort(-sims_without_self, axis=1)[:, :3], atol=atol)
+        np.testing.assert_allclose(sims_mat[row_ids, near_ids], near_sims, atol=atol)
+        np.testing.assert_allclose(far_sims, np.sort(sims_without_self, axis=1)[:, :3], atol=atol)
+        np.testing.assert_allclose(sims_mat[row_ids, far_ids], far_sims, atol=atol)
+        self.assertFalse(np.any(near_ids == row_ids) or np.any(far_ids == row_ids))
+
+    def test_neighbour_index(self):
+        vocab = ['w{}'.format(i) for i in range(30)]
+        embed_mat = np.random.RandomState(42).randn(30, 8)
+        w2e = EmbeddingTable(embed_mat, vocab)
+        sims_mat = w2e.normalized.dot(w2e.normalized.T)
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch.object(NeighbourIndex, 'build', wraps=NeighbourIndex.build) as build:
+            index = NeighbourIndex.load_or_build(Path(tmp_dir), w2e, k=5, block_size=7)
+            for row_id, w in enumerate(vocab):
+                col_ids = [i for i in np.argsort(-sims_mat[row_id]) if i != row_id]
+                self.assertEqual([n for n, _ in index.neighbours(w, 5)], [vocab[i] for i in col_ids[:5]])
+                self.assertEqual([n for n, _ in index.farthest(w, 5)], [vocab[i] for i in col_ids[::-1][:5]])
+            # saved index is loaded - if it has at least k neighbours
+            loaded_index = NeighbourIndex.load_or_build(Path(tmp_dir), w2e, k=3)
+            self.assertEqual(build.call_count, 1)
+            self.assertEqual(loaded_index.neighbours('w0', 3), index.neighbours('w0', 3))
+            NeighbourIndex.load_or_build(Path(tmp_dir), w2e, k=8)
+            self.assertEqual(build.call_count, 2)
+            NeighbourIndex.load_or_build(Path(tmp_dir), EmbeddingTable(embed_mat + 1, vocab), k=8)
+            self.assertEqual(build.call_count, 3)
+
+    def test_calc_accuracy(self):
+        eval_sims_mat = np.array([[0.9, 0.1, 0.5, 0.2, 0.0],
+                                  [0.3, 0.3, 0.3, 0.4, np.nan]])
+        eval_candidates_mat = np.array([['a', 'b', 'c', 'd', 'e'],
+                                        ['f', 'g', 'h', 'i', 'j']])
+        with mock.patch.object(config.Eval, 'num_relata', 2), mock.patch.object(config.Eval, 'num_lures', 3):
+            # 3 + 1 correct pairs in row 1 - ties and nan are incorrect in row 2
+            self.assertEqual(calc_accuracy(eval_sims_mat, ['x', 'y'], eval_candidates_mat), 4 / 12)
+
+    def test_to_eval_sims_mat(self):
+        ev = Identification.__new__(Identification)  # architecture is not needed
+        ev.row_words = ['a', 'b', 'a']
+        ev.col_words = ['x', 'y', 'z']
+        ev.eval_candidates_mat = np.array([['x', 'y'],
+                                           ['z', 'x'],
+                                           ['y', 'z']])
+        sims_mat = np.arange(9).reshape(3, 3)
+        # duplicate row words use the first row with that word - like .index()
+        np.testing.assert_array_equal(ev.to_eval_sims_mat(sims_mat), [[0, 1],
+                                                                      [5, 3],
+                                                                      [1, 2]])
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()